@@ -1,29 +1,299 @@
 import openai
 import os
+import asyncio
+import functools
+import hashlib
+import json
+import re
+import time
+import numpy as np
+import faiss
+import aiohttp
+import orjson
+from async_lru import alru_cache
+from cachetools import TTLCache
 from tenacity import retry, stop_after_attempt, wait_exponential
 from typing import List, Dict, Optional, Any
-from config import OPENAI_API_KEY, GPT_MODEL
-import requests
+from config import OPENAI_API_KEY, GPT_MODEL, EMBEDDINGS_DIMENSION
+from embeddings import embedding_service
+from schemas import AIExplanation, AITranslation, AIModeration
 
 
 # Configure OpenAI
 openai.api_key = OPENAI_API_KEY
 
+# Shared HTTP session for external lookups (lazy-initialized so a running
+# event loop exists; keep-alive avoids repeat TCP/TLS handshakes)
+_http_session = None
+_http_session_lock = asyncio.Lock()
+
+# Urban Dictionary definitions are near-static, so cache them for an hour
+_urban_dictionary_cache = TTLCache(maxsize=10_000, ttl=3600)
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Get or create the shared aiohttp session"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        async with _http_session_lock:
+            if _http_session is None or _http_session.closed:
+                _http_session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=30)
+                )
+    return _http_session
+
 # Check for free/open-source alternative if specified
 USE_OPEN_SOURCE_MODEL = os.getenv("USE_OPEN_SOURCE_MODEL", "false").lower() == "true"
 
+class SemanticLLMCache:
+    """Two-tier cache for LLM responses.
+
+    Tier 1 is an exact match on a SHA256 hash of the request parameters.
+    Tier 2 is a FAISS inner-product search over normalized embeddings of the
+    canonicalized request, so paraphrased lookups for the same term can still
+    hit the cache instead of paying for a fresh OpenAI round trip.
+    """
+
+    def __init__(self, similarity_threshold=0.95, ttl=86400, max_entries=2048):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.exact = {}  # cache key -> (expires_at, response)
+        self.index = faiss.IndexFlatIP(EMBEDDINGS_DIMENSION)
+        self.entries = []  # FAISS position -> (expires_at, cache key)
+
+    def make_key(self, method, model, temperature, **fields):
+        """Build the exact-match key and the text to embed for tier 2"""
+        payload = {"method": method, "model": model, "temperature": temperature}
+        payload.update(fields)
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        text = " ".join(str(value) for value in payload.values() if value is not None)
+        return key, text
+
+    def _embed(self, text):
+        embedding = np.array([embedding_service.model.encode(text)], dtype=np.float32)
+        faiss.normalize_L2(embedding)
+        return embedding
+
+    async def get(self, key, text):
+        """Return a cached response or None, trying exact match first"""
+        now = time.time()
+
+        cached = self.exact.get(key)
+        if cached:
+            expires_at, response = cached
+            if expires_at > now:
+                return response
+            del self.exact[key]
+
+        # Fall back to semantic similarity over previously cached
+        # requests; the encode is a transformer forward pass, so it runs
+        # off the event loop
+        if embedding_service.model and self.index.ntotal > 0:
+            query = await asyncio.to_thread(self._embed, text)
+            distances, indices = self.index.search(query, 1)
+            idx = indices[0][0]
+            if idx != -1 and distances[0][0] >= self.similarity_threshold:
+                expires_at, cached_key = self.entries[idx]
+                if expires_at > now and cached_key in self.exact:
+                    return self.exact[cached_key][1]
+
+        return None
+
+    async def set(self, key, text, response):
+        """Cache a response under both the exact key and its embedding"""
+        expires_at = time.time() + self.ttl
+        self.exact[key] = (expires_at, response)
+
+        if embedding_service.model:
+            embedding = await asyncio.to_thread(self._embed, text)
+            self.index.add(embedding)
+            self.entries.append((expires_at, key))
+
+        # Amortized sweep keeps both tiers bounded instead of growing
+        # for the life of the process
+        if len(self.entries) > 2 * self.max_entries or len(self.exact) > 2 * self.max_entries:
+            self._compact()
+
+    def _compact(self):
+        """Drop expired entries and rebuild tier 2 within its bound"""
+        now = time.time()
+        self.exact = {key: value for key, value in self.exact.items() if value[0] > now}
+        if len(self.exact) > self.max_entries:
+            # Keep the entries with the most lifetime left
+            self.exact = dict(
+                sorted(self.exact.items(), key=lambda item: item[1][0])[-self.max_entries:]
+            )
+
+        keep = [
+            (position, entry) for position, entry in enumerate(self.entries)
+            if entry[0] > now and entry[1] in self.exact
+        ][-self.max_entries:]
+
+        index = faiss.IndexFlatIP(EMBEDDINGS_DIMENSION)
+        if keep:
+            index.add(np.vstack([self.index.reconstruct(position) for position, _ in keep]))
+        self.index = index
+        self.entries = [entry for _, entry in keep]
+
+# Bound concurrent OpenAI calls so parallel work stays inside rate limits
+_openai_semaphore = asyncio.Semaphore(25)
+
+def _parse_retry_wait(value):
+    """Parse a Retry-After value in seconds or an OpenAI reset duration like "6m12s" """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+
+    total = 0.0
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|s|m|h)", str(value)):
+        total += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total or None
+
+def retry_openai(max_attempts=3, max_wait=10):
+    """Retry decorator for OpenAI calls that respects rate-limit headers
+
+    On 429 it sleeps for the server-provided Retry-After (or
+    x-ratelimit-reset-requests) instead of a blind exponential wait.
+    Connection errors and 5xx responses back off exponentially.
+    Client errors (bad request, auth) are never retried.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            delay = 2
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    return await func(*args, **kwargs)
+                except openai.error.RateLimitError as e:
+                    if attempt == max_attempts:
+                        raise
+                    headers = getattr(e, "headers", None) or {}
+                    wait = _parse_retry_wait(
+                        headers.get("Retry-After")
+                        or headers.get("x-ratelimit-reset-requests")
+                    )
+                    await asyncio.sleep(wait if wait is not None else delay)
+                except (openai.error.APIConnectionError,
+                        openai.error.ServiceUnavailableError,
+                        openai.error.Timeout):
+                    if attempt == max_attempts:
+                        raise
+                    await asyncio.sleep(delay)
+                except openai.error.APIError as e:
+                    # Only 5xx server errors are worth retrying
+                    if attempt == max_attempts or (getattr(e, "http_status", None) or 500) < 500:
+                        raise
+                    await asyncio.sleep(delay)
+                delay = min(delay * 2, max_wait)
+        return wrapper
+    return decorator
+
 class AIService:
     def __init__(self, model=GPT_MODEL):
         self.model = model
-    
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+
+    async def _bounded(self, coro):
+        """Run a coroutine while holding a slot of the OpenAI semaphore"""
+        async with _openai_semaphore:
+            return await coro
+
+    async def process_submission(
+        self,
+        term: str,
+        meaning: str,
+        examples: Optional[List[str]] = None,
+        target_languages: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Explain, moderate and translate a submission concurrently
+
+        The independent OpenAI calls complete in roughly the time of the
+        slowest one instead of their sum.
+        """
+        examples = examples or []
+        target_languages = target_languages or []
+
+        explanation, moderation, *translations = await asyncio.gather(
+            self._bounded(self.generate_explanation(term)),
+            self._bounded(self.moderate_submission(term, meaning, examples)),
+            *(
+                self._bounded(self.translate_slang(term, language, meaning, examples))
+                for language in target_languages
+            )
+        )
+
+        return {
+            "explanation": explanation,
+            "moderation": moderation,
+            "translations": dict(zip(target_languages, translations))
+        }
+
+    async def bulk_process(self, terms: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Process many submissions concurrently, bounded by the semaphore
+
+        Each entry should have "term" and "meaning" plus optional
+        "examples" and "target_languages" keys.
+        """
+        return await asyncio.gather(*(
+            self.process_submission(
+                entry["term"],
+                entry["meaning"],
+                entry.get("examples"),
+                entry.get("target_languages")
+            )
+            for entry in terms
+        ))
+
     async def generate_explanation(self, term: str, context: Optional[str] = None) -> Dict[str, Any]:
         """Generate an explanation for a slang term using GPT-4"""
-        context_prompt = f" in the context of {context}" if context else ""
-        
-        prompt = f"""
-        Explain the slang term "{term}"{context_prompt} in a way that's easy for non-native speakers to understand.
-        
+        # Normalize so "Lit" and "lit " share a cache entry
+        term = term.strip().lower()
+        try:
+            return await self._generate_explanation(term, context)
+        except Exception:
+            # The fallback lives out here so the alru layer only ever
+            # memoizes successes; a transient failure is retried on the
+            # next call instead of being served for the cache TTL
+            return {
+                "meaning": f"Failed to generate explanation for '{term}'",
+                "origin": "unknown",
+                "examples": [],
+                "pronunciation": "unknown",
+                "part_of_speech": "unknown",
+                "alternative_spellings": []
+            }
+
+    async def generate_explanations_batch(
+        self, terms: List[str], context: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Generate explanations for many terms concurrently
+
+        Each call holds a slot of the OpenAI semaphore, so the fan-out
+        completes in rate-limit-bounded parallel time; cached terms
+        resolve without an API call at all.
+        """
+        return await asyncio.gather(*(
+            self._bounded(self.generate_explanation(term, context))
+            for term in terms
+        ))
+
+    @alru_cache(maxsize=1024, ttl=86400)
+    @retry_openai()
+    async def _generate_explanation(self, term: str, context: Optional[str] = None) -> Dict[str, Any]:
+        cache_key, cache_text = llm_cache.make_key(
+            "generate_explanation", self.model, 0.3, term=term, context=context
+        )
+        cached = await llm_cache.get(cache_key, cache_text)
+        if cached is not None:
+            return cached
+
+        # Keep the instruction block stable in the system message so OpenAI's
+        # server-side prompt cache can reuse it; only the term/context vary
+        system_prompt = """
+        You are a helpful assistant specialized in explaining slang terms to international students learning English.
+
+        Explain the slang term the user provides in a way that's easy for non-native speakers to understand.
+
         Include:
         1. A clear definition
         2. The origin if you know it
@@ -31,127 +301,250 @@ class AIService:
         4. Pronunciation guide if relevant
         5. Part of speech
         6. Alternative spellings or variations if any exist
-        
-        Format your response as a JSON object with these keys: 
+
+        Format your response as a JSON object with these keys:
         "meaning", "origin", "examples", "pronunciation", "part_of_speech", "alternative_spellings"
-        
+
         If you're uncertain about any aspect, use "unknown" as the value.
         """
-        
+
+        context_prompt = f" in the context of {context}" if context else ""
+        prompt = f'Explain the slang term "{term}"{context_prompt}.'
+
         response = await openai.ChatCompletion.acreate(
             model=self.model,
             messages=[
-                {"role": "system", "content": "You are a helpful assistant specialized in explaining slang terms to international students learning English."},
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.3,
-            max_tokens=500,
             response_format={"type": "json_object"}
         )
         
-        try:
-            # Parse the JSON response
-            explanation = response.choices[0].message.content
-            return explanation
-        except Exception as e:
-            # Handle parsing errors
-            return {
-                "meaning": f"Failed to generate explanation for '{term}'",
-                "origin": "unknown",
-                "examples": [],
-                "pronunciation": "unknown",
-                "part_of_speech": "unknown",
-                "alternative_spellings": []
-            }
+        # Parse and validate the JSON response; parse errors propagate so
+        # they aren't memoized by the alru layer
+        explanation = AIExplanation.model_validate(
+            orjson.loads(response.choices[0].message.content)
+        ).model_dump()
+        await llm_cache.set(cache_key, cache_text, explanation)
+        return explanation
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    async def translate_slang(
-        self, 
-        term: str, 
-        target_language: str, 
-        meaning: Optional[str] = None, 
+    def _translation_messages(
+        self,
+        term: str,
+        target_language: str,
+        meaning: Optional[str] = None,
         examples: Optional[List[str]] = None
-    ) -> Dict[str, Any]:
-        """Translate a slang term to another language with contextual examples"""
+    ) -> List[Dict[str, str]]:
+        """Build the chat messages for a translation request"""
+        # Stable instructions live in the system message for prompt caching;
+        # the target language is part of the dynamic user message
+        system_prompt = """
+        You are a helpful assistant specialized in translating English slang terms into other languages.
+
+        Translate the English slang term the user provides into the requested target language.
+
+        Provide:
+        1. The closest equivalent slang or expression in the target language
+        2. A literal translation if different from the slang equivalent
+        3. 2-3 example sentences in the target language showing proper usage
+
+        Format your response as a JSON object with these keys:
+        "translation", "literal_translation", "examples"
+        """
+
         meaning_prompt = f"with the meaning: {meaning}" if meaning else ""
         examples_prompt = ""
         if examples and len(examples) > 0:
             examples_str = "\n".join([f"- {example}" for example in examples])
             examples_prompt = f"\nHere are some example usages in English:\n{examples_str}"
-        
+
         prompt = f"""
         Translate the English slang term "{term}" {meaning_prompt} into {target_language}.
         {examples_prompt}
-        
-        Provide:
-        1. The closest equivalent slang or expression in {target_language}
-        2. A literal translation if different from the slang equivalent
-        3. 2-3 example sentences in {target_language} showing proper usage
-        
-        Format your response as a JSON object with these keys:
-        "translation", "literal_translation", "examples"
         """
-        
-        response = await openai.ChatCompletion.acreate(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": f"You are a helpful assistant specialized in translating slang terms from English to {target_language}."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.3,
-            max_tokens=500,
-            response_format={"type": "json_object"}
-        )
-        
+
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+
+    async def translate_slang(
+        self,
+        term: str,
+        target_language: str,
+        meaning: Optional[str] = None,
+        examples: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Translate a slang term to another language with contextual examples"""
+        # Normalize the term; examples are unhashable for the LRU layer and
+        # rarely change the translation, so they pass through untouched
+        term = term.strip().lower()
         try:
-            # Parse the JSON response
-            translation = response.choices[0].message.content
-            return translation
-        except Exception as e:
-            # Handle parsing errors
+            return await self._translate_slang(
+                term, target_language, meaning,
+                tuple(examples) if examples else None
+            )
+        except Exception:
+            # Built outside the cached layer so only successes are memoized
             return {
                 "translation": f"Failed to translate '{term}' to {target_language}",
                 "literal_translation": "unknown",
                 "examples": []
             }
+
+    @alru_cache(maxsize=1024, ttl=86400)
+    @retry_openai()
+    async def _translate_slang(
+        self,
+        term: str,
+        target_language: str,
+        meaning: Optional[str] = None,
+        examples: Optional[tuple] = None
+    ) -> Dict[str, Any]:
+        cache_key, cache_text = llm_cache.make_key(
+            "translate_slang", self.model, 0.3,
+            term=term, target_language=target_language, meaning=meaning
+        )
+        cached = await llm_cache.get(cache_key, cache_text)
+        if cached is not None:
+            return cached
+
+        response = await openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=self._translation_messages(term, target_language, meaning, examples),
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+        
+        # Parse and validate the JSON response; parse errors propagate so
+        # they aren't memoized by the alru layer
+        translation = AITranslation.model_validate(
+            orjson.loads(response.choices[0].message.content)
+        ).model_dump()
+        await llm_cache.set(cache_key, cache_text, translation)
+        return translation
     
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    async def batch_translate(self, items: List[Dict[str, Any]]) -> str:
+        """Submit a translation backfill through the OpenAI Batch API
+
+        Batch requests run at half the interactive price with a 24h
+        completion window and bypass interactive rate limits, which is
+        plenty for non-interactive backfills. Each item needs "id",
+        "term" and "target_language" plus optional "meaning"/"examples".
+        Returns the batch ID; poll it with retrieve_batch.
+        """
+        lines = []
+        for item in items:
+            body = {
+                "model": self.model,
+                "messages": self._translation_messages(
+                    item["term"],
+                    item["target_language"],
+                    item.get("meaning"),
+                    item.get("examples")
+                ),
+                "temperature": 0.3,
+                "response_format": {"type": "json_object"}
+            }
+            lines.append(orjson.dumps({
+                "custom_id": str(item["id"]),
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": body
+            }))
+
+        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+        session = await get_http_session()
+
+        # Upload the JSONL input file, then create the batch
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        form.add_field(
+            "file", b"\n".join(lines),
+            filename="translations.jsonl", content_type="application/jsonl"
+        )
+        async with session.post(
+            "https://api.openai.com/v1/files", data=form, headers=headers
+        ) as response:
+            input_file = await response.json()
+
+        async with session.post(
+            "https://api.openai.com/v1/batches",
+            json={
+                "input_file_id": input_file["id"],
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h"
+            },
+            headers=headers
+        ) as response:
+            batch = await response.json()
+
+        return batch["id"]
+
+    async def retrieve_batch(self, batch_id: str) -> Dict[str, Any]:
+        """Get the status and result file IDs of a submitted batch"""
+        headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
+        session = await get_http_session()
+
+        async with session.get(
+            f"https://api.openai.com/v1/batches/{batch_id}", headers=headers
+        ) as response:
+            return await response.json()
+
+    @retry_openai()
     async def moderate_submission(self, term: str, meaning: str, examples: List[str]) -> Dict[str, Any]:
         """Check if a user submission is appropriate and likely accurate"""
-        examples_str = "\n".join([f"- {example}" for example in examples]) if examples else "None provided"
-        
-        prompt = f"""
-        Review this slang term submission:
-        
-        Term: {term}
-        Meaning: {meaning}
-        Examples: 
-        {examples_str}
-        
-        Please evaluate:
+        # Safe to cache: temperature is near-deterministic at 0.1
+        cache_key, cache_text = llm_cache.make_key(
+            "moderate_submission", self.model, 0.1,
+            term=term, meaning=meaning, examples=examples
+        )
+        cached = await llm_cache.get(cache_key, cache_text)
+        if cached is not None:
+            return cached
+
+        # Stable evaluation rubric in the system message for prompt caching
+        system_prompt = """
+        You are a helpful assistant that moderates slang term submissions.
+
+        Review the slang term submission the user provides and evaluate:
         1. If this contains inappropriate content (profanity, hate speech, explicit content, etc.)
         2. If the meaning seems accurate based on your knowledge
         3. If the examples match the provided meaning
         4. Any suggestions for improving the submission
-        
+
         Format your response as a JSON object with these keys:
         "is_appropriate" (boolean), "is_accurate" (boolean), "examples_match" (boolean), "suggestions" (string), "confidence" (float between 0-1)
         """
-        
+
+        examples_str = "\n".join([f"- {example}" for example in examples]) if examples else "None provided"
+
+        prompt = f"""
+        Review this slang term submission:
+
+        Term: {term}
+        Meaning: {meaning}
+        Examples:
+        {examples_str}
+        """
+
         response = await openai.ChatCompletion.acreate(
             model=self.model,
             messages=[
-                {"role": "system", "content": "You are a helpful assistant that moderates slang term submissions."},
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt}
             ],
             temperature=0.1,
-            max_tokens=500,
             response_format={"type": "json_object"}
         )
         
         try:
-            # Parse the JSON response
-            moderation = response.choices[0].message.content
+            # Parse and validate the JSON response
+            moderation = AIModeration.model_validate(
+                orjson.loads(response.choices[0].message.content)
+            ).model_dump()
+            await llm_cache.set(cache_key, cache_text, moderation)
             return moderation
         except Exception as e:
             # Handle parsing errors
@@ -164,14 +557,20 @@ class AIService:
             }
         
 
-    async def fetch_from_urban_dictionary(term: str) -> Dict[str, Any]:
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    async def fetch_from_urban_dictionary(self, term: str) -> Dict[str, Any]:
         """Fetch definition from Urban Dictionary API"""
+        cache_key = term.lower()
+        if cache_key in _urban_dictionary_cache:
+            return _urban_dictionary_cache[cache_key]
+
         url = f"https://api.urbandictionary.com/v0/define?term={term}"
-        
+
         try:
-            response = requests.get(url)
-            data = response.json()
-            
+            session = await get_http_session()
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=3)) as response:
+                data = await response.json()
+
             if not data.get("list"):
                 return {
                     "meaning": f"No definition found for '{term}'",
@@ -181,14 +580,16 @@ class AIService:
             
             # Get the top definition (highest thumbs up)
             top_def = max(data["list"], key=lambda x: x.get("thumbs_up", 0))
-            
-            return {
+
+            result = {
                 "meaning": top_def.get("definition", ""),
                 "examples": [top_def.get("example", "")] if top_def.get("example") else [],
                 "origin": "Urban Dictionary",
                 "created_at": top_def.get("written_on")
             }
-            
+            _urban_dictionary_cache[cache_key] = result
+            return result
+
         except Exception as e:
             return {
                 "meaning": f"Error fetching definition: {str(e)}",
@@ -198,5 +599,6 @@ class AIService:
 
 
 
-# Create a singleton instance
+# Create singleton instances
+llm_cache = SemanticLLMCache()
 ai_service = AIService()
\ No newline at end of file
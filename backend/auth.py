@@ -2,32 +2,119 @@ import firebase_admin
 from firebase_admin import credentials, auth
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select, lambda_stmt
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import User
-from database import get_db
+from database import get_db, SessionLocal
 from config import FIREBASE_CREDENTIALS
+from cachetools import TTLCache
+import asyncio
 import datetime
+import hashlib
+import time
 
-# Initialize Firebase Admin SDK
-try:
-    cred = credentials.Certificate(FIREBASE_CREDENTIALS)
-    firebase_admin.initialize_app(cred)
-except Exception as e:
-    print(f"Firebase initialization error: {e}")
+# Firebase ID tokens are valid for an hour, so cache the decoded claims
+# and only pay for signature verification once per token
+_token_cache = TTLCache(maxsize=10_000, ttl=3600)
+
+# Short-lived User row cache; also debounces the last_login update to
+# at most once per minute per user instead of every request
+_user_cache = TTLCache(maxsize=10_000, ttl=60)
+
+def invalidate_user_cache(uid):
+    """Drop a cached User row after its role or profile changes
+
+    Without this a role change could keep serving the stale row for
+    up to the cache TTL.
+    """
+    _user_cache.pop(uid, None)
+
+# Queued last_login timestamps, written in bulk by the flush loop instead
+# of turning every authenticated request into a write transaction
+_pending_logins = {}
+
+def _take_pending_logins():
+    """Swap the queue for a fresh dict and return the snapshot
+
+    Must run on the event loop: handlers queue entries there, so the
+    swap can't interleave with a write and no entry is ever lost or
+    mutated while the flush thread iterates it.
+    """
+    global _pending_logins
+    pending, _pending_logins = _pending_logins, {}
+    return pending
+
+def _write_logins(pending):
+    """Write a batch of last_login updates in a single bulk UPDATE"""
+    if not pending:
+        return
+
+    updates = [
+        {"id": uid, "last_login": last_login}
+        for uid, last_login in pending.items()
+    ]
+
+    db = SessionLocal()
+    try:
+        db.bulk_update_mappings(User, updates)
+        db.commit()
+    finally:
+        db.close()
+
+def flush_pending_logins():
+    """Flush all queued last_login updates (call from the event loop)"""
+    _write_logins(_take_pending_logins())
+
+async def flush_logins_loop(interval=30):
+    """Background task that periodically flushes queued last_login updates"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Snapshot on the loop, then run the sync bulk UPDATE on a
+            # worker thread so the loop never blocks request handling
+            pending = _take_pending_logins()
+            await asyncio.to_thread(_write_logins, pending)
+        except Exception as e:
+            print(f"Error flushing last_login updates: {e}")
+
+# Firebase Admin SDK initializes lazily (or from the startup event) so
+# importing this module doesn't pay the credential load cost
+_firebase_initialized = False
+
+def init_firebase():
+    """Initialize the Firebase Admin SDK (idempotent)"""
+    global _firebase_initialized
+    if _firebase_initialized:
+        return
+    try:
+        cred = credentials.Certificate(FIREBASE_CREDENTIALS)
+        firebase_admin.initialize_app(cred)
+        _firebase_initialized = True
+    except Exception as e:
+        print(f"Firebase initialization error: {e}")
 
 # Security scheme
 security = HTTPBearer()
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Verify Firebase token and get current user"""
+    init_firebase()
+
     token = credentials.credentials
+    token_key = hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
     try:
-        # Verify the token with Firebase
-        decoded_token = auth.verify_id_token(token)
-        
+        # Verify the token with Firebase, reusing the cached claims while
+        # the token is still comfortably within its lifetime
+        decoded_token = _token_cache.get(token_key)
+        if decoded_token is None or decoded_token.get("exp", 0) <= time.time() + 30:
+            # Signature verification is blocking (and may fetch Google's
+            # signing certs), so keep it off the event loop
+            decoded_token = await asyncio.to_thread(auth.verify_id_token, token)
+            _token_cache[token_key] = decoded_token
+
         # Get user ID from the token
         uid = decoded_token.get("uid")
         if not uid:
@@ -35,14 +122,22 @@ async def get_current_user(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid authentication credentials"
             )
-        
-        # Get user from database or create if not exists
-        user = db.query(User).filter(User.id == uid).first()
-        
+
+        # Serve recently seen users from cache, skipping the query and
+        # the per-request last_login write
+        cached_user = _user_cache.get(uid)
+        if cached_user is not None:
+            return cached_user
+
+        # Get user from database or create if not exists; lambda_stmt
+        # caches the compiled SQL for this per-request lookup
+        stmt = lambda_stmt(lambda: select(User).where(User.id == uid))
+        user = (await db.execute(stmt)).scalar_one_or_none()
+
         if not user:
             # User doesn't exist in our database yet
             email = decoded_token.get("email", "")
-            
+
             # Create new user
             user = User(
                 id=uid,
@@ -50,13 +145,12 @@ async def get_current_user(
                 last_login=datetime.datetime.now()
             )
             db.add(user)
-            db.commit()
-            db.refresh(user)
+            await db.commit()
         else:
-            # Update last login time
-            user.last_login = datetime.datetime.now()
-            db.commit()
-        
+            # Queue the last_login update for the next bulk flush
+            _pending_logins[uid] = datetime.datetime.now()
+
+        _user_cache[uid] = user
         return user
         
     except auth.ExpiredIdTokenError:
@@ -0,0 +1,38 @@
+import redis as sync_redis
+import redis.asyncio as redis
+from fastapi_cache import FastAPICache
+from config import REDIS_URL
+
+# Shared async Redis client for rate limiting and response caching.
+# Callers are expected to fall back gracefully if Redis is unavailable.
+redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+
+# Synchronous client for code that runs outside the event loop (the
+# embedding service); left binary-safe for packed float32 vectors
+sync_redis_client = sync_redis.from_url(REDIS_URL)
+
+def endpoint_key_builder(func, namespace="", *, request=None, response=None, args=(), kwargs=None):
+    """Build a cache key from the endpoint name and its scalar arguments
+
+    Request-scoped values (DB session, current user) are skipped so
+    identical requests share one cache entry. The decorator hands custom
+    builders the bare namespace, so the global prefix is added here —
+    without it, FastAPICache.clear() (which deletes by prefix) would
+    never match these keys and the write-path invalidation would be a
+    no-op.
+    """
+    kwargs = kwargs or {}
+    scalars = {
+        key: value for key, value in sorted(kwargs.items())
+        if isinstance(value, (str, int, float, bool, type(None)))
+    }
+    prefix = FastAPICache.get_prefix()
+    return f"{prefix}:{namespace}:{func.__module__}.{func.__name__}:{scalars}"
+
+async def clear_response_cache():
+    """Drop all cached endpoint responses after a data-changing write"""
+    try:
+        await FastAPICache.clear()
+    except Exception:
+        # Cache not initialized or Redis unavailable; entries just expire
+        pass
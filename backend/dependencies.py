@@ -1,54 +1,134 @@
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select, lambda_stmt, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload, undefer
+import asyncio
 import datetime
 from typing import Optional
-from database import get_db
+from database import get_db, SessionLocal
 from models import User, SlangTerm
 from config import MAX_SUBMISSIONS_PER_DAY
 from embeddings import embedding_service
 from auth import get_current_user
+from cache import redis_client
+
+def encode_page_cursor(term):
+    """Keyset cursor for a (created_at DESC, id DESC) page boundary"""
+    return f"{term.created_at.isoformat()}|{term.id}"
+
+def decode_page_cursor(cursor):
+    """Parse a keyset cursor back into (created_at, id), 400 if malformed"""
+    try:
+        created_at, _, term_id = cursor.partition("|")
+        return datetime.datetime.fromisoformat(created_at), int(term_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
 
 async def get_embedding_service():
     """Dependency for the embedding service"""
     return embedding_service
 
-async def check_submission_limit(user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def _submission_key(user_id, now):
+    return f"submissions:{user_id}:{now.date().isoformat()}"
+
+async def consume_submission_quota(user: User):
+    """Count a successful submission against the user's daily quota
+
+    Called after the insert commits, so failed attempts (duplicate-term
+    409s and the like) never burn allowance. Redis being down is fine:
+    the limit check falls back to counting rows actually created.
+    """
+    if user.role in ["admin", "moderator"]:
+        return
+    try:
+        key = _submission_key(user.id, datetime.datetime.now())
+        count = await redis_client.incr(key)
+        if count == 1:
+            await redis_client.expire(key, 86400)
+    except Exception:
+        pass
+
+async def check_submission_limit(user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Check if user has exceeded the daily submission limit"""
     # Check if user is admin or moderator (no limits)
     if user.role in ["admin", "moderator"]:
         return user
-    
-    # Get the start of today
-    today_start = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    
+
+    now = datetime.datetime.now()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds_until_midnight = int(
+        (today_start + datetime.timedelta(days=1) - now).total_seconds()
+    )
+
+    # Read the O(1) Redis counter; it only advances when an insert
+    # succeeds (consume_submission_quota), matching the SQL fallback's
+    # count of rows actually created
+    try:
+        count = int(await redis_client.get(_submission_key(user.id, now)) or 0)
+        if count >= MAX_SUBMISSIONS_PER_DAY:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"You have reached the daily submission limit of {MAX_SUBMISSIONS_PER_DAY} terms.",
+                headers={"Retry-After": str(seconds_until_midnight)}
+            )
+
+        return user
+    except HTTPException:
+        raise
+    except Exception:
+        # Redis unavailable, fall back to counting in SQL
+        pass
+
     # Count submissions made today
     today_submissions = (
-        db.query(SlangTerm)
-        .filter(
-            SlangTerm.submitted_by == user.id,
-            SlangTerm.created_at >= today_start
+        await db.execute(
+            select(func.count(SlangTerm.id)).where(
+                SlangTerm.submitted_by == user.id,
+                SlangTerm.created_at >= today_start
+            )
         )
-        .count()
-    )
-    
+    ).scalar()
+
     if today_submissions >= MAX_SUBMISSIONS_PER_DAY:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"You have reached the daily submission limit of {MAX_SUBMISSIONS_PER_DAY} terms."
+            detail=f"You have reached the daily submission limit of {MAX_SUBMISSIONS_PER_DAY} terms.",
+            headers={"Retry-After": str(seconds_until_midnight)}
         )
-    
+
     return user
 
-async def get_slang_term(slang_id: int, db: Session = Depends(get_db)) -> SlangTerm:
-    """Get a slang term by ID or raise 404"""
-    slang_term = db.query(SlangTerm).filter(SlangTerm.id == slang_id).first()
-    
+async def get_slang_term(slang_id: int, db: AsyncSession = Depends(get_db)) -> SlangTerm:
+    """Get a slang term by ID or raise 404
+
+    Eager-loads translations and the submitter so the detail response
+    serializes without lazy loads (which AsyncSession forbids anyway).
+    lambda_stmt caches the compiled SQL across calls for this hot lookup.
+    """
+    stmt = lambda_stmt(
+        lambda: select(SlangTerm)
+        .options(
+            selectinload(SlangTerm.translations),
+            joinedload(SlangTerm.submitter),
+            # The update/moderation paths read and rewrite the deferred
+            # embedding columns; load them here so nothing lazy-loads
+            # later under the async session
+            undefer(SlangTerm.embed_text),
+            undefer(SlangTerm.embedding)
+        )
+        .where(SlangTerm.id == slang_id)
+    )
+    slang_term = (await db.execute(stmt)).scalar_one_or_none()
+
     if not slang_term:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Slang term with ID {slang_id} not found"
         )
-    
+
     return slang_term
 
 async def check_slang_owner(
@@ -58,17 +138,30 @@ async def check_slang_owner(
     """Check if current user is the owner of the slang term or has admin rights"""
     if current_user.role in ["admin", "moderator"]:
         return slang_term
-    
+
     if slang_term.submitted_by != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not authorized to perform this action on this slang term"
         )
-    
+
     return slang_term
 
-async def initialize_index(db: Session = Depends(get_db)):
-    """Ensure the FAISS index is initialized"""
-    if embedding_service.index is None:
+def _build_index_sync():
+    """Build the FAISS index on a worker thread with its own session"""
+    db = SessionLocal()
+    try:
         embedding_service.build_index(db)
-    return embedding_service
\ No newline at end of file
+    finally:
+        db.close()
+
+async def initialize_index():
+    """Ensure the FAISS index is initialized
+
+    Checks the built flag rather than the shard dict: with zero verified
+    terms the dict stays empty forever, which would otherwise trigger a
+    full (futile) rebuild on every search.
+    """
+    if not embedding_service.index_built:
+        await asyncio.to_thread(_build_index_sync)
+    return embedding_service
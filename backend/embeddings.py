@@ -1,119 +1,415 @@
+import asyncio
+import hashlib
 import numpy as np
 import faiss
-import json
+import heapq
+import threading
+from collections import defaultdict
 from sentence_transformers import SentenceTransformer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
 from models import SlangTerm
+from cache import sync_redis_client
 from config import EMBEDDINGS_MODEL, EMBEDDINGS_DIMENSION, SIMILARITY_THRESHOLD
 
 class EmbeddingService:
     def __init__(self):
-        self.model = SentenceTransformer(EMBEDDINGS_MODEL)
+        # The model loads lazily on first use so importing this module
+        # doesn't block startup for the transformer load
+        self.model = None
+        self._model_lock = threading.Lock()
+        # Serializes index mutation (incremental upserts, rebuild swap);
+        # searches stay lock-free
+        self._index_lock = threading.Lock()
         self.dimension = EMBEDDINGS_DIMENSION
         self.threshold = SIMILARITY_THRESHOLD
-        self.index = None
+        # One HNSW shard per partition (context), so a query only scans
+        # the partition it belongs to
+        self.indices = {}
         self.slang_ids = []
-    
+        # HNSW shards can't delete, so removed IDs are masked at query
+        # time until the next full rebuild drops their vectors
+        self._removed_ids = set()
+        # Set once build_index completes; distinguishes "not built yet"
+        # from "built over zero verified terms" (empty indices dict)
+        self.index_built = False
+        # Hit/miss counters for the Redis query-embedding cache
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+
+    def _partition_key(self, context):
+        """Map a term's context to its index shard"""
+        return context or "default"
+
+    def _ensure_model(self):
+        """Load the sentence transformer on first use"""
+        if self.model is None:
+            with self._model_lock:
+                if self.model is None:
+                    self.model = SentenceTransformer(EMBEDDINGS_MODEL)
+        return self.model
+
+    def _new_index(self):
+        """Create an empty HNSW index over normalized fp16 vectors (cosine via inner product)
+
+        Half-precision scalar quantization halves the memory per vector
+        with negligible recall loss on normalized embeddings, and unlike
+        product quantization it needs no training pass, so incremental
+        adds keep working. The IDMap2 wrapper stores real slang IDs so
+        entries can be removed individually instead of rebuilding the
+        whole index.
+        """
+        index = faiss.IndexHNSWSQ(
+            self.dimension,
+            faiss.ScalarQuantizer.QT_fp16,
+            32,
+            faiss.METRIC_INNER_PRODUCT
+        )
+        index.hnsw.efConstruction = 200
+        index.hnsw.efSearch = 64
+        return faiss.IndexIDMap2(index)
+
+    def _content_cache_key(self, text):
+        return "temb:" + hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
     def get_embedding(self, text):
-        """Generate embeddings for a text string"""
-        return self.model.encode(text).tolist()
-    
+        """Generate the embedding for a text string, content-hash cached
+
+        Re-imports and retries resubmit identical text, so the vector
+        comes back from Redis instead of another transformer forward
+        pass. Redis being down just means every write encodes.
+        """
+        key = self._content_cache_key(text)
+        try:
+            raw = sync_redis_client.get(key)
+            if raw:
+                return np.frombuffer(raw, dtype=np.float32).copy()
+        except Exception:
+            pass
+
+        embedding = np.asarray(self._ensure_model().encode(text), dtype=np.float32)
+        try:
+            sync_redis_client.setex(key, 86400, embedding.tobytes())
+        except Exception:
+            pass
+        return embedding
+
+    def encode_batch(self, texts, batch_size=64):
+        """Encode a list of texts in batches instead of one call per text"""
+        return self._ensure_model().encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+    def _query_cache_key(self, query):
+        return "qemb:" + hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()
+
+    def _encode_queries(self, queries):
+        """Encode queries, reusing Redis-cached vectors for repeated searches
+
+        Search traffic is heavy-tailed, so hot queries skip the
+        transformer forward pass entirely. Misses are encoded in one
+        batch and written back with a daily TTL; Redis being down just
+        means every query encodes.
+        """
+        embeddings = [None] * len(queries)
+        keys = [self._query_cache_key(query) for query in queries]
+        try:
+            for i, raw in enumerate(sync_redis_client.mget(keys)):
+                if raw:
+                    embeddings[i] = np.frombuffer(raw, dtype=np.float32)
+        except Exception:
+            pass
+
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        self.query_cache_hits += len(queries) - len(misses)
+        self.query_cache_misses += len(misses)
+
+        if misses:
+            encoded = np.asarray(
+                self.encode_batch([queries[i] for i in misses]), dtype=np.float32
+            )
+            for i, embedding in zip(misses, encoded):
+                embeddings[i] = embedding
+            try:
+                pipe = sync_redis_client.pipeline()
+                for i in misses:
+                    pipe.setex(keys[i], 86400, embeddings[i].tobytes())
+                pipe.execute()
+            except Exception:
+                pass
+
+        # np.array copies, so the frombuffer views become writable
+        return np.array(embeddings, dtype=np.float32)
+
+    def get_text_to_embed(self, term):
+        """Build the text that represents a term in the embedding space"""
+        text_to_embed = f"{term.term} {term.meaning}"
+        if term.examples and isinstance(term.examples, list) and len(term.examples) > 0:
+            text_to_embed += " " + " ".join(term.examples[:2])  # Add first two examples
+        return text_to_embed
+
+    def refresh_embed_fields(self, term):
+        """Recompute and store a term's embed_text and embedding
+
+        Called on the write path so index builds become a pure load.
+        Returns False when the embed text is unchanged and the stored
+        vector was kept, letting callers skip the index upsert too.
+        """
+        text = self.get_text_to_embed(term)
+        if term.embed_text == text and term.embedding is not None:
+            return False
+        term.embed_text = text
+        term.embedding = self.get_embedding(text)
+        return True
+
     def build_index(self, db: Session):
-        """Build FAISS index from all verified slang terms in the database"""
-        slang_terms = db.query(SlangTerm).filter(SlangTerm.is_verified == True).all()
-        
-        if not slang_terms:
-            # Create empty index if no terms exist
-            self.index = faiss.IndexFlatL2(self.dimension)
-            self.slang_ids = []
-            return
-        
-        # Get embeddings either from the database or generate new ones
-        embeddings = []
-        self.slang_ids = []
-        
-        for term in slang_terms:
-            if term.embedding:
-                # Use cached embedding
-                embedding = np.array(term.embedding, dtype=np.float32)
-            else:
-                # Generate new embedding
-                text_to_embed = f"{term.term} {term.meaning}"
-                if term.examples and isinstance(term.examples, list) and len(term.examples) > 0:
-                    text_to_embed += " " + " ".join(term.examples[:2])  # Add first two examples
-                
-                embedding = self.model.encode(text_to_embed)
-                
-                # Cache the embedding in the database
-                term.embedding = embedding.tolist()
-                db.commit()
-            
-            embeddings.append(embedding)
-            self.slang_ids.append(term.id)
-        
-        # Convert to numpy array and build FAISS index
-        embeddings_np = np.array(embeddings, dtype=np.float32)
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.index.add(embeddings_np)
-    
-    def search(self, query, limit=10):
+        """Build the FAISS shards from all verified slang terms in the database"""
+        # Terms with a cached embedding only need three columns fetched
+        cached_terms = (
+            db.query(SlangTerm.id, SlangTerm.context, SlangTerm.embedding)
+            .filter(SlangTerm.is_verified == True, SlangTerm.embedding.isnot(None))
+            .all()
+        )
+        # Terms still needing an encode come back as column tuples, not
+        # ORM instances: no identity-map bookkeeping, and only the
+        # columns the embed text is built from leave the database
+        uncached_rows = (
+            db.query(
+                SlangTerm.id,
+                SlangTerm.context,
+                SlangTerm.term,
+                SlangTerm.meaning,
+                SlangTerm.examples,
+                SlangTerm.embed_text
+            )
+            .filter(SlangTerm.is_verified == True, SlangTerm.embedding.is_(None))
+            .all()
+        )
+
+        # Group (id, embedding) pairs by partition
+        groups = defaultdict(list)
+        for term_id, context, embedding in cached_terms:
+            groups[self._partition_key(context)].append(
+                (term_id, np.array(embedding, dtype=np.float32))
+            )
+
+        if uncached_rows:
+            # Build every embed text off the projected columns, preferring
+            # the embed_text precomputed at write time, then encode the
+            # whole set in one batched call
+            texts = []
+            for row in uncached_rows:
+                if row.embed_text:
+                    texts.append(row.embed_text)
+                    continue
+                text = f"{row.term} {row.meaning}"
+                if row.examples and isinstance(row.examples, list):
+                    text += " " + " ".join(row.examples[:2])
+                texts.append(text)
+            new_embeddings = self.encode_batch(texts, batch_size=128)
+
+            # Persist the new embeddings in a single bulk UPDATE; pgvector
+            # takes the float32 arrays directly, no float-list round trip
+            db.bulk_update_mappings(SlangTerm, [
+                {"id": row.id, "embed_text": text, "embedding": embedding}
+                for row, text, embedding in zip(uncached_rows, texts, new_embeddings)
+            ])
+            db.commit()
+
+            for row, embedding in zip(uncached_rows, new_embeddings):
+                groups[self._partition_key(row.context)].append(
+                    (row.id, np.asarray(embedding, dtype=np.float32))
+                )
+
+        # Build one normalized HNSW shard per partition, off to the side
+        # so searches keep hitting the old shards until the swap below
+        indices = {}
+        slang_ids = []
+        for partition, entries in groups.items():
+            ids = np.fromiter(
+                (term_id for term_id, _ in entries), dtype=np.int64, count=len(entries)
+            )
+            embeddings_np = np.array([embedding for _, embedding in entries], dtype=np.float32)
+            faiss.normalize_L2(embeddings_np)
+
+            shard = self._new_index()
+            shard.add_with_ids(embeddings_np, ids)
+            indices[partition] = shard
+            slang_ids.extend(ids.tolist())
+
+        with self._index_lock:
+            self.indices = indices
+            self.slang_ids = slang_ids
+            self._removed_ids = set()
+            self.index_built = True
+
+    def add_or_update(self, term):
+        """Insert or refresh a single term in its shard without a rebuild
+
+        An update leaves the previous vector behind under the same ID
+        (HNSW can't delete); search keeps only the best score per ID, and
+        the explicit rebuild endpoint compacts the shards.
+        """
+        if term.embedding is None:
+            self.refresh_embed_fields(term)
+
+        embedding = np.asarray([term.embedding], dtype=np.float32)
+        faiss.normalize_L2(embedding)
+
+        # Concurrent writers (request handlers, rebuild threads) are
+        # serialized; reads stay lock-free
+        with self._index_lock:
+            partition = self._partition_key(term.context)
+            shard = self.indices.get(partition)
+            if shard is None:
+                shard = self.indices[partition] = self._new_index()
+
+            shard.add_with_ids(embedding, np.array([term.id], dtype=np.int64))
+            self._removed_ids.discard(term.id)
+            if term.id not in self.slang_ids:
+                self.slang_ids.append(term.id)
+
+    def remove(self, term_id):
+        """Hide a term from search results without a rebuild"""
+        with self._index_lock:
+            self._removed_ids.add(term_id)
+
+    def _search_shards(self, query_embeddings, limit, context=None):
+        """Search one shard, or merge top-k across all shards
+
+        Returns one list of (score, slang_id) pairs per query row, best first.
+        """
+        if context is not None:
+            shard = self.indices.get(self._partition_key(context))
+            shards = [shard] if shard is not None else []
+        else:
+            shards = list(self.indices.values())
+
+        merged = [[] for _ in range(len(query_embeddings))]
+        for shard in shards:
+            if shard.ntotal == 0:
+                continue
+            scores, ids = shard.search(query_embeddings, limit)
+            for row, (row_scores, row_ids) in enumerate(zip(scores, ids)):
+                merged[row].extend(
+                    (float(score), int(slang_id))
+                    for score, slang_id in zip(row_scores, row_ids)
+                    if slang_id != -1 and int(slang_id) not in self._removed_ids
+                )
+
+        # Keep the best score per ID so a superseded vector from
+        # add_or_update never shadows its replacement
+        deduped = []
+        for row in merged:
+            best = {}
+            for score, slang_id in row:
+                if score > best.get(slang_id, float("-inf")):
+                    best[slang_id] = score
+            deduped.append(heapq.nlargest(
+                limit, ((score, slang_id) for slang_id, score in best.items())
+            ))
+
+        return deduped
+
+    def search(self, query, limit=10, context=None):
         """Search for similar slang terms using vector similarity"""
-        if not self.index or self.index.ntotal == 0:
-            return []
-        
-        # Generate query embedding
-        query_embedding = self.model.encode(query)
-        query_embedding = np.array([query_embedding], dtype=np.float32)
-        
-        # Search the index
-        distances, indices = self.index.search(query_embedding, limit)
-        
-        # Convert to slang IDs with similarity scores
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(self.slang_ids):  # Valid index
-                similarity = 1.0 - (distances[0][i] / 2.0)  # Convert L2 distance to similarity
-                if similarity >= self.threshold:
+        return self.search_batch([query], limit, context)[0]
+
+    def search_batch(self, queries, limit=10, context=None):
+        """Search the shards for many queries with one encode per batch
+
+        Returns one result list per query, in the same order. With a
+        context, only that partition's shard is scanned.
+        """
+        if not self.indices:
+            return [[] for _ in queries]
+
+        # Encode all queries in a single batched call, via the Redis cache
+        query_embeddings = self._encode_queries(queries)
+        faiss.normalize_L2(query_embeddings)
+
+        batch_results = []
+        for row in self._search_shards(query_embeddings, limit, context):
+            results = []
+            for score, slang_id in row:
+                if score >= self.threshold:
                     results.append({
-                        "slang_id": self.slang_ids[idx],
-                        "similarity": float(similarity)
+                        "slang_id": slang_id,
+                        "similarity": score
                     })
-        
+            batch_results.append(results)
+
+        return batch_results
+
+    async def search_db(self, db, query, limit=10):
+        """Search verified slang terms using the pgvector HNSW index in Postgres"""
+        # Encoding runs the transformer, so keep it off the event loop
+        query_embedding = (await asyncio.to_thread(self._encode_queries, [query]))[0]
+        distance = SlangTerm.embedding.cosine_distance(query_embedding).label("distance")
+
+        rows = (
+            await db.execute(
+                select(SlangTerm.id, distance)
+                .where(
+                    SlangTerm.is_verified == True,
+                    SlangTerm.embedding.isnot(None)
+                )
+                .order_by(distance)
+                .limit(limit)
+            )
+        ).all()
+
+        results = []
+        for slang_id, dist in rows:
+            similarity = 1.0 - dist
+            if similarity >= self.threshold:
+                results.append({
+                    "slang_id": slang_id,
+                    "similarity": float(similarity)
+                })
+
         return results
-    
+
     def find_similar_terms(self, term_text, db: Session, limit=5):
         """Find similar terms to a given text"""
-        if not self.index or self.index.ntotal == 0:
+        if not self.indices:
             return []
-        
+
         # Generate embedding for the term
-        query_embedding = self.model.encode(term_text)
+        query_embedding = self._ensure_model().encode(term_text)
         query_embedding = np.array([query_embedding], dtype=np.float32)
-        
-        # Search the index
-        distances, indices = self.index.search(query_embedding, limit + 1)  # +1 to account for possibly finding self
-        
-        # Get similar terms
+        faiss.normalize_L2(query_embedding)
+
+        # Search the shards
+        matches = self._search_shards(query_embedding, limit + 1)[0]  # +1 to account for possibly finding self
+
+        # Fetch all candidates in a single query, only the columns we need
+        candidate_ids = [slang_id for _, slang_id in matches]
+        if not candidate_ids:
+            return []
+
+        rows = {
+            term.id: term
+            for term in db.query(SlangTerm)
+            .options(load_only(SlangTerm.id, SlangTerm.term))
+            .filter(SlangTerm.id.in_(candidate_ids))
+            .all()
+        }
+
+        # Get similar terms, preserving rank order
         similar_terms = []
-        for i, idx in enumerate(indices[0]):
-            if idx != -1 and idx < len(self.slang_ids):
-                slang_id = self.slang_ids[idx]
-                
-                # Fetch term from database
-                term = db.query(SlangTerm).filter(SlangTerm.id == slang_id).first()
-                
-                if term and term.term.lower() != term_text.lower():  # Skip self
-                    similarity = 1.0 - (distances[0][i] / 2.0)
-                    if similarity >= self.threshold:
-                        similar_terms.append({
-                            "id": term.id,
-                            "term": term.term,
-                            "similarity": float(similarity)
-                        })
-                        
-                        if len(similar_terms) >= limit:
-                            break
-        
+        for score, slang_id in matches:
+            term = rows.get(slang_id)
+
+            if term and term.term.lower() != term_text.lower():  # Skip self
+                if score >= self.threshold:
+                    similar_terms.append({
+                        "id": term.id,
+                        "term": term.term,
+                        "similarity": score
+                    })
+
+                    if len(similar_terms) >= limit:
+                        break
+
         return similar_terms
     
     def batch_index_update(self, db: Session, term_ids=None):
@@ -125,15 +421,15 @@ class EmbeddingService:
                 SlangTerm.is_verified == True
             ).all()
             
-            for term in terms:
-                text_to_embed = f"{term.term} {term.meaning}"
-                if term.examples and isinstance(term.examples, list) and len(term.examples) > 0:
-                    text_to_embed += " " + " ".join(term.examples[:2])
-                
-                embedding = self.model.encode(text_to_embed)
-                term.embedding = embedding.tolist()
-            
-            db.commit()
+            if terms:
+                texts = [self.get_text_to_embed(term) for term in terms]
+                new_embeddings = self.encode_batch(texts)
+
+                for term, text, embedding in zip(terms, texts, new_embeddings):
+                    term.embed_text = text
+                    term.embedding = embedding
+
+                db.commit()
         
         # Rebuild full index
         self.build_index(db)
@@ -1,15 +1,155 @@
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session
 
-from database import get_db, engine, Base
-from config import ALLOWED_ORIGINS
+import asyncio
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+
+from database import engine, Base, SessionLocal, warm_async_pool
+from config import ALLOWED_ORIGINS, EMBEDDINGS_DIMENSION
 from routers import slang, search, users, admin, community
 from embeddings import embedding_service
+from auth import flush_logins_loop, flush_pending_logins, init_firebase
+from cache import redis_client
+
+# Enable pgvector before creating tables so the Vector column type exists,
+# and pg_trgm for trigram-indexed keyword search
+with engine.connect() as connection:
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    connection.commit()
 
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# ANN index for embedding similarity search in Postgres, plus a trigram
+# index so ILIKE keyword search doesn't sequentially scan the table
+with engine.connect() as connection:
+    # Columns added by this series; create_all doesn't alter existing
+    # tables, so bring old databases up to the model before the index
+    # and backfill DDL below references them
+    connection.execute(text(
+        "ALTER TABLE slang_terms ADD COLUMN IF NOT EXISTS "
+        "vote_count integer NOT NULL DEFAULT 0"
+    ))
+    connection.execute(text(
+        "ALTER TABLE slang_terms ADD COLUMN IF NOT EXISTS embed_text text"
+    ))
+    # Native jsonb for the list columns (a no-op cast once converted) so
+    # containment filters can use the GIN index below instead of a scan
+    connection.execute(text(
+        "ALTER TABLE slang_terms ALTER COLUMN alternative_spellings TYPE jsonb "
+        "USING alternative_spellings::jsonb"
+    ))
+    connection.execute(text(
+        "ALTER TABLE slang_terms ALTER COLUMN examples TYPE jsonb USING examples::jsonb"
+    ))
+    connection.execute(text(
+        "ALTER TABLE slang_translations ALTER COLUMN examples TYPE jsonb USING examples::jsonb"
+    ))
+    connection.execute(text(
+        "ALTER TABLE users ALTER COLUMN learning_languages TYPE jsonb "
+        "USING learning_languages::jsonb"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_slang_examples_gin ON slang_terms "
+        "USING gin (examples jsonb_path_ops)"
+    ))
+    # Databases created before the pgvector switch carry embedding as a
+    # json column; convert it in place (guarded so the table rewrite
+    # only ever runs once) or the hnsw index below fails and the app
+    # cannot boot
+    connection.execute(text(
+        "ALTER TABLE slang_terms ADD COLUMN IF NOT EXISTS "
+        f"embedding vector({EMBEDDINGS_DIMENSION})"
+    ))
+    connection.execute(text(f"""
+        DO $$
+        BEGIN
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'slang_terms' AND column_name = 'embedding'
+                  AND udt_name <> 'vector'
+            ) THEN
+                ALTER TABLE slang_terms ALTER COLUMN embedding
+                    TYPE vector({EMBEDDINGS_DIMENSION})
+                    USING NULLIF(embedding::text, 'null')::vector({EMBEDDINGS_DIMENSION});
+            END IF;
+        END $$
+    """))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_slang_terms_embedding ON slang_terms "
+        "USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_slang_terms_trgm ON slang_terms "
+        "USING gin (term gin_trgm_ops, meaning gin_trgm_ops)"
+    ))
+    # Functional unique index backing the case-insensitive duplicate
+    # check on submission; also closes the check-then-insert race
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_slang_term_lower ON slang_terms (lower(term))"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_slang_terms_vote_count ON slang_terms "
+        "(vote_count DESC) WHERE is_verified"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_slang_votes_user ON slang_votes "
+        "(user_id) INCLUDE (slang_id, vote)"
+    ))
+    # One row per (user, term) so the favorites toggle can upsert
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_user_favorites_user_slang "
+        "ON user_favorites (user_id, slang_id)"
+    ))
+    # One vote per (term, user); existing DBs predate the model-level
+    # constraint, and the vote upsert's ON CONFLICT needs it
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_slang_votes_slang_user "
+        "ON slang_votes (slang_id, user_id)"
+    ))
+    # Partial indexes matching the moderation queue and recent listings,
+    # which filter on is_verified and order by created_at DESC
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_slang_terms_pending ON slang_terms "
+        "(created_at DESC) WHERE is_verified = false"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_slang_terms_verified_recent ON slang_terms "
+        "(created_at DESC) WHERE is_verified = true"
+    ))
+    # Composite index serving the keyset-paginated listings, which seek
+    # on (created_at, id) row comparisons
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_slang_terms_created_id ON slang_terms "
+        "(created_at DESC, id DESC)"
+    ))
+    # Rewrite the child FKs with ON DELETE CASCADE so deleting a term is
+    # a single statement; idempotent drop-and-recreate for existing DBs
+    for table in ("slang_votes", "slang_translations", "user_favorites"):
+        connection.execute(text(
+            f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_slang_id_fkey"
+        ))
+        connection.execute(text(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_slang_id_fkey "
+            "FOREIGN KEY (slang_id) REFERENCES slang_terms(id) ON DELETE CASCADE"
+        ))
+    # Backfill the denormalized vote counts; a no-op whenever they are
+    # already in step with the votes table
+    connection.execute(text(
+        "UPDATE slang_terms SET vote_count = COALESCE(v.vc, 0) "
+        "FROM (SELECT slang_id, SUM(vote) AS vc FROM slang_votes GROUP BY slang_id) v "
+        "WHERE slang_terms.id = v.slang_id "
+        "AND slang_terms.vote_count IS DISTINCT FROM COALESCE(v.vc, 0)"
+    ))
+    connection.commit()
+
 # Initialize app
 app = FastAPI(
     title="AI-Powered Slang Dictionary API",
@@ -26,6 +166,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request, exc):
+    """Turn an exhausted connection pool into a fast 503
+
+    With pool_timeout bounded, an overloaded worker sheds load quickly
+    instead of queueing requests behind an acquire that may never return.
+    """
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service temporarily overloaded, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
 # Include routers
 app.include_router(slang.router)
 app.include_router(search.router)
@@ -36,14 +189,41 @@ app.include_router(community.router)
 @app.on_event("startup")
 async def startup_event():
     """Initialize services on startup"""
-    try:
-        db = next(get_db())
-        # Build search index on startup
-        if embedding_service.model:  # Only build if model loaded successfully
+    # Redis-backed response cache for the hot read-mostly endpoints
+    FastAPICache.init(RedisBackend(redis_client), prefix="slang")
+
+    def _build_index():
+        # The index build encodes on a worker thread, so give it its
+        # own sync session rather than the request-scoped async one
+        db = SessionLocal()
+        try:
             embedding_service.build_index(db)
+        finally:
+            db.close()
+
+    try:
+        # Load Firebase, warm the connection pool and build the search
+        # index concurrently so startup costs the slowest of the three
+        await asyncio.gather(
+            asyncio.to_thread(init_firebase),
+            asyncio.to_thread(_build_index),
+            warm_async_pool()
+        )
     except Exception as e:
         print(f"Error during startup: {str(e)}")
 
+    # Periodically flush queued last_login updates in bulk; keep the
+    # task referenced on app.state so it isn't garbage-collected
+    app.state.login_flush_task = asyncio.create_task(flush_logins_loop())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush any pending writes before shutting down"""
+    try:
+        flush_pending_logins()
+    except Exception as e:
+        print(f"Error during shutdown: {str(e)}")
+
 @app.get("/")
 async def root():
     """API root endpoint"""
@@ -1,20 +1,28 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, Text, ForeignKey, DateTime, Table, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, Boolean, Text, ForeignKey, DateTime, Table, Index, UniqueConstraint, event, select, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
+from pgvector.sqlalchemy import Vector
 import uuid
 from database import Base
+from config import EMBEDDINGS_DIMENSION
 
 # Association table for user favorites
 user_favorites = Table(
     "user_favorites",
     Base.metadata,
     Column("user_id", String, ForeignKey("users.id")),
-    Column("slang_id", Integer, ForeignKey("slang_terms.id")),
+    Column("slang_id", Integer, ForeignKey("slang_terms.id", ondelete="CASCADE")),
+    # One row per (user, term); lets the favorites endpoint upsert
+    UniqueConstraint("user_id", "slang_id", name="uq_user_favorites_user_slang"),
 )
 
 class SlangTerm(Base):
     __tablename__ = "slang_terms"
-    
+    # Functional unique index: makes the case-insensitive duplicate check
+    # an index lookup and enforces uniqueness race-free at the DB level
+    __table_args__ = (Index("ix_slang_term_lower", text("lower(term)"), unique=True),)
+
     id = Column(Integer, primary_key=True, index=True)
     term = Column(String(100), nullable=False, index=True)
     meaning = Column(Text, nullable=False)
@@ -22,30 +30,38 @@ class SlangTerm(Base):
     context = Column(String(255))  # Where/how the slang is typically used
     part_of_speech = Column(String(50))
     pronunciation = Column(String(255))
-    alternative_spellings = Column(JSON)  # Store as JSON array
-    examples = Column(JSON)  # Store as JSON array of example sentences
+    alternative_spellings = Column(JSONB)  # Store as JSONB array
+    examples = Column(JSONB)  # Store as JSONB array of example sentences
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     is_verified = Column(Boolean, default=False)
     submitted_by = Column(String, ForeignKey("users.id"), nullable=True)
+    # Denormalized SUM(slang_votes.vote), kept in step by sync_vote_count
+    # so list endpoints can ORDER BY an indexed column
+    vote_count = Column(Integer, nullable=False, default=0, server_default="0")
     
-    # Vector embedding for the term (cached)
-    embedding = Column(JSON)
+    # Text the embedding was computed from, precomputed at write time.
+    # Deferred along with the vector so list queries don't drag either
+    # over the wire on every row; paths that need them undefer explicitly
+    embed_text = deferred(Column(Text))
+    # Vector embedding for the term (pgvector, cached)
+    embedding = deferred(Column(Vector(EMBEDDINGS_DIMENSION)))
     
-    # Relationships
-    votes = relationship("SlangVote", back_populates="slang_term")
-    translations = relationship("SlangTranslation", back_populates="slang_term")
+    # Relationships; passive_deletes defers child cleanup to the
+    # ON DELETE CASCADE FKs, so deleting a term is one statement
+    votes = relationship("SlangVote", back_populates="slang_term", passive_deletes=True)
+    translations = relationship("SlangTranslation", back_populates="slang_term", passive_deletes=True)
     submitter = relationship("User", back_populates="submitted_terms")
-    favorited_by = relationship("User", secondary=user_favorites, back_populates="favorites")
+    favorited_by = relationship("User", secondary=user_favorites, back_populates="favorites", passive_deletes=True)
 
 class SlangTranslation(Base):
     __tablename__ = "slang_translations"
     
     id = Column(Integer, primary_key=True, index=True)
-    slang_id = Column(Integer, ForeignKey("slang_terms.id"))
+    slang_id = Column(Integer, ForeignKey("slang_terms.id", ondelete="CASCADE"))
     language = Column(String(10), nullable=False)  # Language code (e.g., "es", "fr")
     translation = Column(Text, nullable=False)
-    examples = Column(JSON)  # Store as JSON array of translated examples
+    examples = Column(JSONB)  # Store as JSONB array of translated examples
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationship
@@ -53,9 +69,11 @@ class SlangTranslation(Base):
 
 class SlangVote(Base):
     __tablename__ = "slang_votes"
-    
+    # One vote per user per term; lets the vote endpoint upsert
+    __table_args__ = (UniqueConstraint("slang_id", "user_id", name="uq_slang_votes_slang_user"),)
+
     id = Column(Integer, primary_key=True, index=True)
-    slang_id = Column(Integer, ForeignKey("slang_terms.id"))
+    slang_id = Column(Integer, ForeignKey("slang_terms.id", ondelete="CASCADE"))
     user_id = Column(String, ForeignKey("users.id"))
     vote = Column(Integer)  # 1 for upvote, -1 for downvote
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -64,6 +82,37 @@ class SlangVote(Base):
     slang_term = relationship("SlangTerm", back_populates="votes")
     user = relationship("User", back_populates="votes")
 
+def vote_count_update(slang_id):
+    """UPDATE statement recomputing the denormalized vote_count for one term
+
+    Used by the ORM event listeners below and executed directly by code
+    that writes votes with Core statements (which bypass the listeners).
+    """
+    slang_terms = SlangTerm.__table__
+    slang_votes = SlangVote.__table__
+    return (
+        slang_terms.update()
+        .where(slang_terms.c.id == slang_id)
+        .values(
+            vote_count=select(func.coalesce(func.sum(slang_votes.c.vote), 0))
+            .where(slang_votes.c.slang_id == slang_id)
+            .scalar_subquery(),
+            # Pin updated_at to itself so the column-level onupdate does
+            # not stamp a vote sync as a content edit
+            updated_at=slang_terms.c.updated_at
+        )
+    )
+
+def sync_vote_count(connection, slang_id):
+    """Recompute the denormalized vote_count for one term"""
+    connection.execute(vote_count_update(slang_id))
+
+@event.listens_for(SlangVote, "after_insert")
+@event.listens_for(SlangVote, "after_update")
+@event.listens_for(SlangVote, "after_delete")
+def _slang_vote_changed(mapper, connection, target):
+    sync_vote_count(connection, target.slang_id)
+
 class User(Base):
     __tablename__ = "users"
     
@@ -71,7 +120,7 @@ class User(Base):
     email = Column(String(255), unique=True, nullable=False)
     username = Column(String(50), unique=True, nullable=True)
     native_language = Column(String(10), nullable=True)
-    learning_languages = Column(JSON)  # JSON array of language codes
+    learning_languages = Column(JSONB)  # JSONB array of language codes
     role = Column(String(20), default="user")  # "user", "moderator", "admin"
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_login = Column(DateTime(timezone=True))
@@ -86,7 +135,7 @@ class SearchHistory(Base):
     __tablename__ = "search_history"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("users.id"))
+    user_id = Column(String, ForeignKey("users.id"), index=True)
     query = Column(String(255))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -1,14 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, case, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-import json
+import asyncio
 import datetime
 
-from database import get_db
-from models import SlangTerm, User, SlangVote
+from database import get_db, SessionLocal
+from models import SlangTerm, User
 from schemas import SlangTermResponse, ModerateRequest, StatsResponse
+from fastapi_cache.decorator import cache
+
 from auth import get_moderator_user
+from cache import endpoint_key_builder, clear_response_cache
 from dependencies import get_slang_term, initialize_index
 from ai_service import ai_service
 from embeddings import embedding_service
@@ -22,56 +25,48 @@ router = APIRouter(
 async def get_pending_submissions(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_moderator_user)
 ):
     """Get pending slang term submissions for moderation"""
     # Query unverified terms
     pending_terms = (
-        db.query(SlangTerm)
-        .filter(SlangTerm.is_verified == False)
-        .order_by(desc(SlangTerm.created_at))
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
-    
-    # Add vote counts to each term
-    results = []
-    for term in pending_terms:
-        vote_count = (
-            db.query(func.sum(SlangVote.vote))
-            .filter(SlangVote.slang_id == term.id)
-            .scalar() or 0
+        await db.execute(
+            select(SlangTerm)
+            .where(SlangTerm.is_verified == False)
+            .order_by(desc(SlangTerm.created_at))
+            .offset(skip)
+            .limit(limit)
         )
-        term_response = SlangTermResponse.from_orm(term)
-        term_response.vote_count = vote_count
-        results.append(term_response)
-    
-    return results
+    ).scalars().all()
+
+
+    # vote_count is denormalized on the row, so one query covers everything
+    return [SlangTermResponse.from_orm(term) for term in pending_terms]
 
 @router.post("/moderate/{slang_id}", response_model=SlangTermResponse)
 async def moderate_submission(
     moderate_request: ModerateRequest,
     slang_term: SlangTerm = Depends(get_slang_term),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_moderator_user)
 ):
     """Moderate a slang term submission (approve, reject, update)"""
     if moderate_request.action == "approve":
         # Approve the submission
         slang_term.is_verified = True
-        db.commit()
-        db.refresh(slang_term)
-        
-        # Rebuild the search index
-        embedding_service.build_index(db)
-        
+        await db.commit()
+
+        # Add the approved term to the search index in place
+        embedding_service.add_or_update(slang_term)
+
     elif moderate_request.action == "reject":
         # Delete the submission
-        db.delete(slang_term)
-        db.commit()
-        
+        await db.delete(slang_term)
+        await db.commit()
+        embedding_service.remove(moderate_request.slang_id)
+        await clear_response_cache()
+
         # Return empty response since term is deleted
         return SlangTermResponse(
             id=moderate_request.slang_id,
@@ -99,42 +94,31 @@ async def moderate_submission(
         slang_term.alternative_spellings = moderate_request.updates.alternative_spellings or []
         slang_term.examples = moderate_request.updates.examples or []
         slang_term.is_verified = True  # Auto-verify after update
-        
-        # Update embedding
-        text_to_embed = f"{slang_term.term} {slang_term.meaning}"
-        if slang_term.examples:
-            text_to_embed += " " + " ".join(slang_term.examples[:2])
-        slang_term.embedding = embedding_service.get_embedding(text_to_embed)
-        
-        db.commit()
-        db.refresh(slang_term)
-        
-        # Rebuild the search index
-        embedding_service.build_index(db)
-        
+
+        # Update the embedding text and vector, off the event loop
+        # since it runs the transformer
+        await asyncio.to_thread(embedding_service.refresh_embed_fields, slang_term)
+
+        await db.commit()
+
+        # Refresh the term in the search index in place
+        embedding_service.add_or_update(slang_term)
+
     else:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid action. Must be 'approve', 'reject', or 'update'."
         )
     
-    # Get vote count for response
-    vote_count = (
-        db.query(func.sum(SlangVote.vote))
-        .filter(SlangVote.slang_id == slang_term.id)
-        .scalar() or 0
-    )
-    
-    # Build response
-    response = SlangTermResponse.from_orm(slang_term)
-    response.vote_count = vote_count
-    
-    return response
+    # Cached stats/popular/trending responses are stale after moderation
+    await clear_response_cache()
+
+    # Build response; vote_count is already on the term row
+    return SlangTermResponse.from_orm(slang_term)
 
 @router.post("/ai-moderate/{slang_id}")
 async def ai_moderate_submission(
     slang_term: SlangTerm = Depends(get_slang_term),
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_moderator_user)
 ):
     """Use AI to help moderate a slang term submission"""
@@ -142,89 +126,78 @@ async def ai_moderate_submission(
     examples = slang_term.examples or []
     
     # Call AI moderation service
-    moderation_result = await ai_service.moderate_submission(
+    moderation = await ai_service.moderate_submission(
         slang_term.term,
         slang_term.meaning,
         examples
     )
-    
-    # Parse the JSON response if it's a string
-    if isinstance(moderation_result, str):
-        moderation = json.loads(moderation_result)
-    else:
-        moderation = moderation_result
-    
+
     return moderation
 
 @router.get("/stats", response_model=StatsResponse)
+@cache(expire=60, key_builder=endpoint_key_builder)
 async def get_admin_stats(
     days: int = Query(30, description="Stats for the last N days"),
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_moderator_user)
 ):
     """Get detailed statistics for admin dashboard"""
-    # Define the date range
-    recent_date = datetime.datetime.now() - datetime.timedelta(days=days)
-    
-    # Count total terms
-    total_terms = db.query(func.count(SlangTerm.id)).scalar()
-    
-    # Count verified terms
-    verified_terms = db.query(func.count(SlangTerm.id)).filter(SlangTerm.is_verified == True).scalar()
-    
-    # Count pending terms
-    pending_terms = db.query(func.count(SlangTerm.id)).filter(SlangTerm.is_verified == False).scalar()
-    
-    # Get recent submissions
-    recent_submissions = (
-        db.query(SlangTerm)
-        .filter(SlangTerm.created_at >= recent_date)
-        .order_by(SlangTerm.created_at.desc())
-        .limit(10)
-        .all()
-    )
-    
-    # Get popular terms (most votes)
-    popular_subquery = (
-        db.query(
-            SlangTerm.id,
-            func.sum(SlangVote.vote).label("vote_count")
-        )
-        .join(SlangVote)
-        .group_by(SlangTerm.id)
-        .order_by(func.sum(SlangVote.vote).desc())
-        .limit(10)
-        .subquery()
-    )
-    
-    popular_terms = (
-        db.query(SlangTerm)
-        .join(popular_subquery, SlangTerm.id == popular_subquery.c.id)
-        .all()
+    # Compute the cutoff on the server so the only bind is the integer
+    # day count and the plan cache can be reused across calls
+    recent_cutoff = func.now() - func.make_interval(0, 0, 0, days)
+
+    # The three queries are independent, so run them on their own
+    # sessions and pay only for the slowest one
+    def _fetch_counts():
+        db = SessionLocal()
+        try:
+            # Total, verified and pending in one conditionally aggregated query
+            return (
+                db.query(
+                    func.count(SlangTerm.id),
+                    func.coalesce(func.sum(case((SlangTerm.is_verified == True, 1), else_=0)), 0),
+                    func.coalesce(func.sum(case((SlangTerm.is_verified == False, 1), else_=0)), 0)
+                )
+                .one()
+            )
+        finally:
+            db.close()
+
+    def _fetch_recent():
+        db = SessionLocal()
+        try:
+            return (
+                db.query(SlangTerm)
+                .filter(SlangTerm.created_at >= recent_cutoff)
+                .order_by(SlangTerm.created_at.desc())
+                .limit(10)
+                .all()
+            )
+        finally:
+            db.close()
+
+    def _fetch_popular():
+        db = SessionLocal()
+        try:
+            # Straight off the denormalized count, correctly ordered
+            return (
+                db.query(SlangTerm)
+                .order_by(SlangTerm.vote_count.desc())
+                .limit(10)
+                .all()
+            )
+        finally:
+            db.close()
+
+    counts, recent_submissions, popular_terms = await asyncio.gather(
+        asyncio.to_thread(_fetch_counts),
+        asyncio.to_thread(_fetch_recent),
+        asyncio.to_thread(_fetch_popular)
     )
-    
-    # Format response with vote counts
-    recent_with_votes = []
-    for term in recent_submissions:
-        vote_count = (
-            db.query(func.sum(SlangVote.vote))
-            .filter(SlangVote.slang_id == term.id)
-            .scalar() or 0
-        )
-        term_response = SlangTermResponse.from_orm(term)
-        term_response.vote_count = vote_count
-        recent_with_votes.append(term_response)
-    
-    popular_with_votes = []
-    for term in popular_terms:
-        vote_count = (
-            db.query(func.sum(SlangVote.vote))
-            .filter(SlangVote.slang_id == term.id)
-            .scalar() or 0
-        )
-        term_response = SlangTermResponse.from_orm(term)
-        term_response.vote_count = vote_count
-        popular_with_votes.append(term_response)
+    total_terms, verified_terms, pending_terms = counts
+
+    # vote_count comes along with each row now
+    recent_with_votes = [SlangTermResponse.from_orm(term) for term in recent_submissions]
+    popular_with_votes = [SlangTermResponse.from_orm(term) for term in popular_terms]
     
     return StatsResponse(
         total_terms=total_terms,
@@ -236,9 +209,16 @@ async def get_admin_stats(
 
 @router.post("/rebuild-index", status_code=status.HTTP_200_OK)
 async def rebuild_search_index(
-    db: Session = Depends(get_db),
     current_user: User = Depends(get_moderator_user)
 ):
     """Manually rebuild the search index (admin only)"""
-    embedding_service.build_index(db)
+    def _rebuild():
+        db = SessionLocal()
+        try:
+            embedding_service.build_index(db)
+        finally:
+            db.close()
+
+    # Rebuilds encode and index on a worker thread with a sync session
+    await asyncio.to_thread(_rebuild)
     return {"status": "success", "message": "Search index rebuilt successfully"}
\ No newline at end of file
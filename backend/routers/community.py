@@ -1,11 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, case, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
-from models import SlangTerm, SlangVote, User
+from models import SlangTerm, SlangVote, User, vote_count_update
 from schemas import VoteCreate, VoteResponse, StatsResponse, SlangTermResponse
+from fastapi_cache.decorator import cache
+
 from auth import get_current_user
+from cache import endpoint_key_builder, clear_response_cache
 
 router = APIRouter(
     prefix="/community",
@@ -15,139 +19,123 @@ router = APIRouter(
 @router.post("/vote", response_model=VoteResponse)
 async def vote_on_slang(
     vote: VoteCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Vote on a slang term (upvote, downvote, or remove vote)"""
-    # Check if slang term exists and is verified
-    slang_term = db.query(SlangTerm).filter(SlangTerm.id == vote.slang_id).first()
-    if not slang_term:
+    # Check existence and verification without loading the whole row
+    # (notably the embedding vector)
+    row = (
+        await db.execute(
+            select(SlangTerm.id, SlangTerm.is_verified)
+            .where(SlangTerm.id == vote.slang_id)
+        )
+    ).first()
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Slang term with ID {vote.slang_id} not found"
         )
-    
-    if not slang_term.is_verified:
+
+    if not row.is_verified:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Cannot vote on unverified slang terms"
         )
-    
-    # Check existing vote
-    existing_vote = (
-        db.query(SlangVote)
-        .filter(
-            SlangVote.slang_id == vote.slang_id,
-            SlangVote.user_id == current_user.id
-        )
-        .first()
-    )
-    
-    if existing_vote:
-        if vote.vote == 0:
-            # Remove vote
-            db.delete(existing_vote)
-            db.commit()
-            return VoteResponse(
-                id=0,
-                slang_id=vote.slang_id,
-                vote=0,
-                created_at=None
-            )
-        else:
-            # Update vote
-            existing_vote.vote = vote.vote
-            db.commit()
-            db.refresh(existing_vote)
-            return VoteResponse.from_orm(existing_vote)
-    else:
-        if vote.vote == 0:
-            # No-op if trying to remove a non-existent vote
-            return VoteResponse(
-                id=0,
-                slang_id=vote.slang_id,
-                vote=0,
-                created_at=None
+
+    if vote.vote == 0:
+        # Remove any existing vote with a single DELETE; a no-op if
+        # there was nothing to remove
+        result = await db.execute(
+            delete(SlangVote).where(
+                SlangVote.slang_id == vote.slang_id,
+                SlangVote.user_id == current_user.id
             )
-        
-        # Create new vote
-        new_vote = SlangVote(
+        )
+        if result.rowcount:
+            await db.execute(vote_count_update(vote.slang_id))
+        await db.commit()
+        if result.rowcount:
+            await clear_response_cache()
+        return VoteResponse(
+            id=0,
+            slang_id=vote.slang_id,
+            vote=0,
+            created_at=None
+        )
+
+    # Insert or update the vote in a single upsert instead of
+    # SELECT-then-insert/update, and skip the refresh round-trip by
+    # reading the row back through RETURNING
+    stmt = (
+        pg_insert(SlangVote)
+        .values(
             slang_id=vote.slang_id,
             user_id=current_user.id,
             vote=vote.vote
         )
-        db.add(new_vote)
-        db.commit()
-        db.refresh(new_vote)
-        
-        return VoteResponse.from_orm(new_vote)
+        .on_conflict_do_update(
+            index_elements=["slang_id", "user_id"],
+            set_={"vote": vote.vote}
+        )
+        .returning(SlangVote.id, SlangVote.created_at)
+    )
+    row = (await db.execute(stmt)).first()
+    # Core upserts bypass the ORM listeners, so refresh the
+    # denormalized count here in the same transaction
+    await db.execute(vote_count_update(vote.slang_id))
+    await db.commit()
+    await clear_response_cache()
+
+    return VoteResponse(
+        id=row.id,
+        slang_id=vote.slang_id,
+        vote=vote.vote,
+        created_at=row.created_at
+    )
 
 @router.get("/stats", response_model=StatsResponse)
+@cache(expire=300, key_builder=endpoint_key_builder)
 async def get_community_stats(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get community statistics"""
-    # Count total terms
-    total_terms = db.query(func.count(SlangTerm.id)).scalar()
-    
-    # Count verified terms
-    verified_terms = db.query(func.count(SlangTerm.id)).filter(SlangTerm.is_verified == True).scalar()
-    
-    # Count pending terms
-    pending_terms = db.query(func.count(SlangTerm.id)).filter(SlangTerm.is_verified == False).scalar()
-    
+    # Count total, verified and pending terms in one conditionally aggregated query
+    total_terms, verified_terms, pending_terms = (
+        await db.execute(
+            select(
+                func.count(SlangTerm.id),
+                func.coalesce(func.sum(case((SlangTerm.is_verified == True, 1), else_=0)), 0),
+                func.coalesce(func.sum(case((SlangTerm.is_verified == False, 1), else_=0)), 0)
+            )
+        )
+    ).one()
+
     # Get recent submissions (last 10)
     recent_submissions = (
-        db.query(SlangTerm)
-        .filter(SlangTerm.is_verified == True)
-        .order_by(SlangTerm.created_at.desc())
-        .limit(10)
-        .all()
-    )
-    
-    # Get popular terms (most votes)
-    popular_subquery = (
-        db.query(
-            SlangTerm.id,
-            func.count(SlangVote.id).label("vote_count")
+        await db.execute(
+            select(SlangTerm)
+            .where(SlangTerm.is_verified == True)
+            .order_by(SlangTerm.created_at.desc())
+            .limit(10)
         )
-        .join(SlangVote)
-        .filter(SlangTerm.is_verified == True)
-        .group_by(SlangTerm.id)
-        .order_by(func.count(SlangVote.id).desc())
-        .limit(10)
-        .subquery()
-    )
-    
+    ).scalars().all()
+
+    # Get popular terms (most votes) straight off the denormalized
+    # count, correctly ordered, with no aggregation or rejoin
     popular_terms = (
-        db.query(SlangTerm)
-        .join(popular_subquery, SlangTerm.id == popular_subquery.c.id)
-        .all()
-    )
-    
-    # Format response with vote counts
-    recent_with_votes = []
-    for term in recent_submissions:
-        vote_count = (
-            db.query(func.sum(SlangVote.vote))
-            .filter(SlangVote.slang_id == term.id)
-            .scalar() or 0
-        )
-        term_response = SlangTermResponse.from_orm(term)
-        term_response.vote_count = vote_count
-        recent_with_votes.append(term_response)
-    
-    popular_with_votes = []
-    for term in popular_terms:
-        vote_count = (
-            db.query(func.sum(SlangVote.vote))
-            .filter(SlangVote.slang_id == term.id)
-            .scalar() or 0
+        await db.execute(
+            select(SlangTerm)
+            .where(SlangTerm.is_verified == True)
+            .order_by(SlangTerm.vote_count.desc())
+            .limit(10)
         )
-        term_response = SlangTermResponse.from_orm(term)
-        term_response.vote_count = vote_count
-        popular_with_votes.append(term_response)
-    
+    ).scalars().all()
+
+    # vote_count comes along with each row now
+    recent_with_votes = [SlangTermResponse.from_orm(term) for term in recent_submissions]
+    popular_with_votes = [SlangTermResponse.from_orm(term) for term in popular_terms]
+
     return StatsResponse(
         total_terms=total_terms,
         verified_terms=verified_terms,
@@ -158,17 +146,18 @@ async def get_community_stats(
 
 @router.get("/my-votes")
 async def get_user_votes(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get current user's votes"""
-    user_votes = (
-        db.query(SlangVote)
-        .filter(SlangVote.user_id == current_user.id)
-        .all()
-    )
-    
+    # Project just the two columns the response needs; the covering
+    # index on user_id serves this without touching the table
+    rows = (
+        await db.execute(
+            select(SlangVote.slang_id, SlangVote.vote)
+            .where(SlangVote.user_id == current_user.id)
+        )
+    ).all()
+
     # Format as dictionary for easy lookup
-    vote_map = {vote.slang_id: vote.vote for vote in user_votes}
-    
-    return vote_map
\ No newline at end of file
+    return dict(rows)
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Query
+from sqlalchemy import func, or_, case, delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-import datetime
+import asyncio
+
+from database import get_db, SessionLocal
+from models import SlangTerm, SlangVote, User, SearchHistory
+from schemas import SearchQuery, SearchResponse, SlangTermResponse, BulkSearchQuery
+from fastapi_cache.decorator import cache
 
-from database import get_db
-from models import SlangTerm, User, SearchHistory
-from schemas import SearchQuery, SearchResponse, SlangTermResponse
 from auth import get_current_user
+from cache import endpoint_key_builder
 from dependencies import initialize_index
 from embeddings import EmbeddingService
 
@@ -16,246 +19,301 @@ router = APIRouter(
     tags=["search"]
 )
 
+def _record_search_history(user_id, query):
+    """Persist one search to history in its own short-lived session
+
+    Runs as a background task so the WAL fsync of the history INSERT
+    doesn't sit on the search latency path.
+    """
+    db = SessionLocal()
+    try:
+        db.add(SearchHistory(user_id=user_id, query=query))
+        db.commit()
+    finally:
+        db.close()
+
 @router.post("/", response_model=SearchResponse)
 async def search_slang_terms(
     search_query: SearchQuery,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user),
     embedding_service: EmbeddingService = Depends(initialize_index)
 ):
     """Search for slang terms using keyword or semantic search"""
     query = search_query.query.strip()
-    
+
     if not query:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Search query cannot be empty"
         )
-    
-    # Save search to history
+
+    # Save search to history after the response is sent
     if current_user:
-        search_history = SearchHistory(
-            user_id=current_user.id,
-            query=query
-        )
-        db.add(search_history)
-        db.commit()
-    
+        background_tasks.add_task(_record_search_history, current_user.id, query)
+
     results = []
-    
+
     # Perform semantic search if enabled
     if search_query.semantic:
-        # Get similar terms using vector search
-        semantic_results = embedding_service.search(query, search_query.limit)
-        
+        # Get similar terms using the pgvector index in Postgres
+        semantic_results = await embedding_service.search_db(db, query, search_query.limit)
+
         if semantic_results:
-            # Get slang terms by IDs with vote counts
             slang_ids = [result["slang_id"] for result in semantic_results]
-            
-            # Query database for these terms
-            terms_query = (
-                db.query(SlangTerm)
-                .filter(SlangTerm.id.in_(slang_ids))
-                .filter(SlangTerm.is_verified == True)
+
+            # One query returning the terms already in semantic-rank
+            # order; vote_count rides along on the row
+            ordering = case(
+                {slang_id: position for position, slang_id in enumerate(slang_ids)},
+                value=SlangTerm.id
             )
-            
-            # Preserve the order from semantic search
-            id_to_position = {id: idx for idx, id in enumerate(slang_ids)}
-            terms = terms_query.all()
-            terms.sort(key=lambda x: id_to_position.get(x.id, 999))
-            
-            # Build response with vote counts
-            for term in terms:
-                vote_count = (
-                    db.query(func.coalesce(func.sum(SlangTerm.votes.vote), 0))
-                    .filter(SlangTerm.id == term.id)
-                    .scalar() or 0
+            terms = (
+                await db.execute(
+                    select(SlangTerm)
+                    .where(SlangTerm.id.in_(slang_ids))
+                    .where(SlangTerm.is_verified == True)
+                    .order_by(ordering)
                 )
-                term_response = SlangTermResponse.from_orm(term)
-                term_response.vote_count = vote_count
-                results.append(term_response)
-    
+            ).scalars().all()
+            results.extend(SlangTermResponse.from_orm(term) for term in terms)
+
     # Fall back to keyword search if no semantic results or semantic search is disabled
     if not results:
-        # Perform keyword search
-        keyword_query = (
-            db.query(SlangTerm)
-            .filter(
-                SlangTerm.is_verified == True,
-                or_(
-                    func.lower(SlangTerm.term).contains(query.lower()),
-                    func.lower(SlangTerm.meaning).contains(query.lower())
+        # Perform keyword search; ILIKE can use the trigram GIN index,
+        # LOWER(col) LIKE cannot
+        terms = (
+            await db.execute(
+                select(SlangTerm)
+                .where(
+                    SlangTerm.is_verified == True,
+                    or_(
+                        SlangTerm.term.ilike(f"%{query}%"),
+                        SlangTerm.meaning.ilike(f"%{query}%")
+                    )
                 )
+                .limit(search_query.limit)
             )
-            .limit(search_query.limit)
-        )
-        
-        terms = keyword_query.all()
-        
-        # Build response with vote counts
-        for term in terms:
-            vote_count = (
-                db.query(func.coalesce(func.sum(SlangTerm.votes.vote), 0))
-                .filter(SlangTerm.id == term.id)
-                .scalar() or 0
-            )
-            term_response = SlangTermResponse.from_orm(term)
-            term_response.vote_count = vote_count
-            results.append(term_response)
-    
+        ).scalars().all()
+
+        # vote_count is denormalized on the row
+        results.extend(SlangTermResponse.from_orm(term) for term in terms)
+
     return SearchResponse(
         results=results,
         query=query,
         count=len(results)
     )
 
+@router.post("/bulk", response_model=List[SearchResponse])
+async def search_slang_terms_bulk(
+    bulk_query: BulkSearchQuery,
+    db: AsyncSession = Depends(get_db),
+    current_user: Optional[User] = Depends(get_current_user),
+    embedding_service: EmbeddingService = Depends(initialize_index)
+):
+    """Run semantic search for many queries in one batched call"""
+    queries = [query.strip() for query in bulk_query.queries if query.strip()]
+
+    if not queries:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one non-empty search query is required"
+        )
+
+    # One encode + one FAISS call for the whole batch, off the event loop
+    batch_results = await asyncio.to_thread(
+        embedding_service.search_batch, queries, bulk_query.limit
+    )
+
+    # Fetch every matched term across all queries at once; vote_count
+    # is denormalized on the row
+    all_ids = {result["slang_id"] for results in batch_results for result in results}
+    terms = {}
+    if all_ids:
+        terms = {
+            term.id: term
+            for term in (
+                await db.execute(
+                    select(SlangTerm)
+                    .where(SlangTerm.id.in_(all_ids), SlangTerm.is_verified == True)
+                )
+            ).scalars()
+        }
+
+    responses = []
+    for query, results in zip(queries, batch_results):
+        term_responses = []
+        for result in results:
+            term = terms.get(result["slang_id"])
+            if term:
+                term_responses.append(SlangTermResponse.from_orm(term))
+
+        responses.append(SearchResponse(
+            results=term_responses,
+            query=query,
+            count=len(term_responses)
+        ))
+
+    return responses
+
 @router.get("/trending", response_model=List[SlangTermResponse])
+@cache(expire=600, key_builder=endpoint_key_builder)
 async def get_trending_terms(
     limit: int = Query(10, ge=1, le=100),
     days: int = Query(7, ge=1, le=30),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get trending slang terms based on recent activity"""
-    # Define the date range for trending
-    recent_date = datetime.datetime.now() - datetime.timedelta(days=days)
-    
+    # Compute the cutoff on the server so the only bind is the integer
+    # day count and the plan cache can be reused across calls
+    recent_cutoff = func.now() - func.make_interval(0, 0, 0, days)
+
+    # Quiet period: with no recent votes or searches nothing can trend,
+    # so skip the scoring work and serve the popular list instead. The
+    # response cache on this endpoint memoizes the result either way.
+    has_votes = (
+        await db.execute(
+            select(SlangVote.id)
+            .where(SlangVote.created_at >= recent_cutoff)
+            .limit(1)
+        )
+    ).first()
+    has_searches = (
+        await db.execute(
+            select(SearchHistory.id)
+            .where(SearchHistory.created_at >= recent_cutoff)
+            .limit(1)
+        )
+    ).first()
+    if not has_votes and not has_searches:
+        return await get_popular_terms(limit=limit, db=db)
+
     # Get terms with the most votes in the recent period
     recent_votes_subquery = (
-        db.query(
+        select(
             SlangTerm.id,
             func.count().label("vote_count")
         )
-        .join(SlangTerm.votes)
-        .filter(
+        .join(SlangVote, SlangVote.slang_id == SlangTerm.id)
+        .where(
             SlangTerm.is_verified == True,
-            SlangTerm.votes.created_at >= recent_date
+            SlangVote.created_at >= recent_cutoff
         )
         .group_by(SlangTerm.id)
         .subquery()
     )
-    
+
     # Get terms with the most searches in the recent period
     search_counts = {}
     recent_searches = (
-        db.query(SearchHistory.query, func.count().label("count"))
-        .filter(SearchHistory.created_at >= recent_date)
-        .group_by(SearchHistory.query)
-        .order_by(func.count().desc())
-        .limit(100)
-        .all()
-    )
-    
-    # Count how many times each term appears in searches
-    for search_query, count in recent_searches:
-        for term in db.query(SlangTerm).filter(
-            SlangTerm.is_verified == True,
-            func.lower(SlangTerm.term).contains(func.lower(search_query))
-        ).all():
-            search_counts[term.id] = search_counts.get(term.id, 0) + count
-    
+        await db.execute(
+            select(SearchHistory.query, func.count().label("count"))
+            .where(SearchHistory.created_at >= recent_cutoff)
+            .group_by(SearchHistory.query)
+            .order_by(func.count().desc())
+            .limit(100)
+        )
+    ).all()
+
+    # Count how many times each term appears in searches; fetch the
+    # verified terms once and match in Python instead of running one
+    # unindexable LIKE scan per distinct search string
+    if recent_searches:
+        verified_terms = (
+            await db.execute(
+                select(SlangTerm.id, func.lower(SlangTerm.term))
+                .where(SlangTerm.is_verified == True)
+            )
+        ).all()
+        for search_query, count in recent_searches:
+            query_lower = search_query.lower()
+            for term_id, term_lower in verified_terms:
+                if query_lower in term_lower:
+                    search_counts[term_id] = search_counts.get(term_id, 0) + count
+
     # Combine vote counts and search counts for trending score
     trending_scores = {}
-    
+
     # Add vote-based scores
-    for term_id, vote_count in db.query(recent_votes_subquery).all():
+    for term_id, vote_count in (await db.execute(select(recent_votes_subquery))).all():
         trending_scores[term_id] = trending_scores.get(term_id, 0) + vote_count * 2  # Weight votes higher
-    
+
     # Add search-based scores
     for term_id, search_count in search_counts.items():
         trending_scores[term_id] = trending_scores.get(term_id, 0) + search_count
-    
+
     # Get top trending terms
     top_trending_ids = sorted(
         trending_scores.keys(),
         key=lambda id: trending_scores[id],
         reverse=True
     )[:limit]
-    
-    # Query full term details and vote counts
+
+    # Query full term details
     results = []
     if top_trending_ids:
         terms = (
-            db.query(SlangTerm)
-            .filter(SlangTerm.id.in_(top_trending_ids))
-            .all()
-        )
-        
-        # Sort by trending score and add vote counts
-        terms.sort(key=lambda term: trending_scores.get(term.id, 0), reverse=True)
-        
-        for term in terms:
-            vote_count = (
-                db.query(func.coalesce(func.sum(SlangTerm.votes.vote), 0))
-                .filter(SlangTerm.id == term.id)
-                .scalar() or 0
+            await db.execute(
+                select(SlangTerm).where(SlangTerm.id.in_(top_trending_ids))
             )
-            term_response = SlangTermResponse.from_orm(term)
-            term_response.vote_count = vote_count
-            results.append(term_response)
-    
+        ).scalars().all()
+
+        # Sort by trending score; vote_count is denormalized on the row
+        terms.sort(key=lambda term: trending_scores.get(term.id, 0), reverse=True)
+        results.extend(SlangTermResponse.from_orm(term) for term in terms)
+
     return results
 
 @router.get("/popular", response_model=List[SlangTermResponse])
+@cache(expire=600, key_builder=endpoint_key_builder)
 async def get_popular_terms(
     limit: int = Query(10, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get most popular slang terms based on all-time votes"""
-    # Subquery to get vote counts
-    vote_counts = (
-        db.query(
-            SlangTerm.id,
-            func.coalesce(func.sum(SlangTerm.votes.vote), 0).label("vote_count")
-        )
-        .outerjoin(SlangTerm.votes)
-        .filter(SlangTerm.is_verified == True)
-        .group_by(SlangTerm.id)
-        .order_by(func.coalesce(func.sum(SlangTerm.votes.vote), 0).desc())
-        .limit(limit)
-        .subquery()
-    )
-    
-    # Get terms with vote counts
+    # One indexed ORDER BY over the denormalized count; no aggregation
     terms = (
-        db.query(SlangTerm, vote_counts.c.vote_count)
-        .join(vote_counts, SlangTerm.id == vote_counts.c.id)
-        .order_by(vote_counts.c.vote_count.desc())
-        .all()
-    )
-    
-    # Build response
-    results = []
-    for term, vote_count in terms:
-        term_response = SlangTermResponse.from_orm(term)
-        term_response.vote_count = vote_count
-        results.append(term_response)
-    
-    return results
+        await db.execute(
+            select(SlangTerm)
+            .where(SlangTerm.is_verified == True)
+            .order_by(SlangTerm.vote_count.desc())
+            .limit(limit)
+        )
+    ).scalars().all()
+
+    return [SlangTermResponse.from_orm(term) for term in terms]
 
 @router.get("/history", response_model=List[str])
 async def get_search_history(
     limit: int = Query(20, ge=1, le=100),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get user's search history"""
     history = (
-        db.query(SearchHistory.query)
-        .filter(SearchHistory.user_id == current_user.id)
-        .order_by(SearchHistory.created_at.desc())
-        .limit(limit)
-        .all()
-    )
-    
-    return [item[0] for item in history]
+        await db.execute(
+            select(SearchHistory.query)
+            .where(SearchHistory.user_id == current_user.id)
+            .order_by(SearchHistory.created_at.desc())
+            .limit(limit)
+        )
+    ).scalars().all()
+
+    return list(history)
 
 @router.delete("/history", status_code=status.HTTP_204_NO_CONTENT)
 async def clear_search_history(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Clear user's search history"""
-    db.query(SearchHistory).filter(SearchHistory.user_id == current_user.id).delete()
-    db.commit()
-    
-    return None
\ No newline at end of file
+    # A single DELETE served by the user_id index; no loaded instances
+    # need syncing
+    await db.execute(
+        delete(SearchHistory).where(SearchHistory.user_id == current_user.id)
+    )
+    await db.commit()
+
+    return None
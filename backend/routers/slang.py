@@ -1,20 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status, Query
+from sqlalchemy import func, desc, delete, lambda_stmt, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Optional
-import json
+import asyncio
+import orjson
 
 from database import get_db
 from models import SlangTerm, SlangVote, User, SlangTranslation
 from schemas import (
-    SlangTermCreate, 
-    SlangTermResponse, 
+    SlangTermCreate,
+    SlangTermResponse,
     SlangTermDetail,
     TranslationCreate,
     TranslationResponse
 )
 from auth import get_current_user, get_moderator_user
-from dependencies import get_slang_term, check_submission_limit, check_slang_owner, get_embedding_service
+from cache import redis_client
+from dependencies import (
+    get_slang_term,
+    check_submission_limit,
+    check_slang_owner,
+    consume_submission_quota,
+    get_embedding_service,
+    encode_page_cursor,
+    decode_page_cursor
+)
 from ai_service import ai_service
 from embeddings import embedding_service
 
@@ -26,32 +37,32 @@ router = APIRouter(
 @router.post("/", response_model=SlangTermResponse, status_code=status.HTTP_201_CREATED)
 async def create_slang_term(
     slang_term: SlangTermCreate,
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(check_submission_limit)
 ):
     """Create a new slang term"""
-    
-    # Check if the term already exists
-    existing_term = db.query(SlangTerm).filter(func.lower(SlangTerm.term) == func.lower(slang_term.term)).first()
+
+    # Check if the term already exists; lambda_stmt caches the compiled
+    # SQL so this per-submission check skips statement construction
+    term_lower = slang_term.term.lower()
+    stmt = lambda_stmt(
+        lambda: select(SlangTerm.id).where(func.lower(SlangTerm.term) == term_lower)
+    )
+    existing_term = (await db.execute(stmt)).first()
     if existing_term:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail=f"Slang term '{slang_term.term}' already exists"
         )
-    
+
     # Auto-verify submissions from moderators and admins
     is_verified = current_user.role in ["admin", "moderator"]
-    
+
     # Convert lists to JSON strings for storage
     alternative_spellings = slang_term.alternative_spellings or []
     examples = slang_term.examples or []
-    
-    # Create embedding for the term
-    text_to_embed = f"{slang_term.term} {slang_term.meaning}"
-    if examples:
-        text_to_embed += " " + " ".join(examples[:2])
-    embedding = embedding_service.get_embedding(text_to_embed)
-    
+
     # Create new slang term
     new_slang = SlangTerm(
         term=slang_term.term,
@@ -63,64 +74,129 @@ async def create_slang_term(
         alternative_spellings=alternative_spellings,
         examples=examples,
         is_verified=is_verified,
-        submitted_by=current_user.id,
-        embedding=embedding
+        submitted_by=current_user.id
     )
-    
+
+    # Precompute the embedding text and vector at write time, off the
+    # event loop since it runs the transformer
+    await asyncio.to_thread(embedding_service.refresh_embed_fields, new_slang)
+
     db.add(new_slang)
-    db.commit()
-    db.refresh(new_slang)
-    
-    # Add initial upvote from submitter
-    vote = SlangVote(
-        slang_id=new_slang.id,
-        user_id=current_user.id,
-        vote=1
-    )
-    db.add(vote)
-    db.commit()
-    
-    # Rebuild the search index to include the new term
+    try:
+        # Flush assigns the term id without ending the transaction, so
+        # the initial upvote rides in the same commit: one fsync, and no
+        # window where the term exists voteless
+        await db.flush()
+        db.add(SlangVote(
+            slang_id=new_slang.id,
+            user_id=current_user.id,
+            vote=1
+        ))
+        await db.commit()
+    except IntegrityError:
+        # The unique lower(term) index closes the window between the
+        # existence check above and this insert under concurrency
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Slang term '{slang_term.term}' already exists"
+        )
+
+    # The insert committed, so this attempt counts against the quota
+    await consume_submission_quota(current_user)
+
+    # Add the new term to the search index off the response path; sync
+    # callables run in the threadpool after the response, and errors
+    # surface through the server's exception logging rather than
+    # vanishing with an unreferenced task
     if is_verified:
-        embedding_service.build_index(db)
-    
+        background_tasks.add_task(embedding_service.add_or_update, new_slang)
+
     # Add vote count to response
     response = SlangTermResponse.from_orm(new_slang)
     response.vote_count = 1
-    
+
     return response
 
 @router.get("/", response_model=List[SlangTermResponse])
 async def get_slang_terms(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     verified_only: bool = True,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user)
 ):
     """Get all slang terms with pagination"""
-    query = db.query(SlangTerm)
-    
+    # The default verified first page is by far the hottest read and
+    # identical for every non-moderator, so serve it from Redis. Keys
+    # live under the "slang" response-cache prefix, so the cache clears
+    # on write paths invalidate this too; the TTL bounds staleness when
+    # Redis outlives a clear.
+    feed_key = f"slang:feed:{limit}"
+    cacheable = (
+        verified_only
+        and not cursor
+        and not skip
+        and current_user.role not in ["admin", "moderator"]
+    )
+    if cacheable:
+        try:
+            cached = await redis_client.get(feed_key)
+        except Exception:
+            cached = None
+        if cached:
+            payload = orjson.loads(cached)
+            if payload.get("next_cursor"):
+                response.headers["X-Next-Cursor"] = payload["next_cursor"]
+            return [SlangTermResponse(**item) for item in payload["items"]]
+
+    query = select(SlangTerm)
+
     # Filter by verification status unless user is moderator/admin
     if verified_only and current_user.role not in ["admin", "moderator"]:
-        query = query.filter(SlangTerm.is_verified == True)
-    
-    # Get total votes for each term
-    terms = query.order_by(desc(SlangTerm.created_at)).offset(skip).limit(limit).all()
-    
-    # Add vote count to each term
-    result = []
-    for term in terms:
-        term_dict = SlangTermResponse.from_orm(term)
-        term_dict.vote_count = db.query(func.sum(SlangVote.vote)).filter(SlangVote.slang_id == term.id).scalar() or 0
-        result.append(term_dict)
-    
-    return result
+        query = query.where(SlangTerm.is_verified == True)
+
+    # Keyset pagination: pages stay O(limit) at any depth, unlike OFFSET
+    # which scans and discards skip rows. skip remains as a fallback for
+    # clients that don't send the cursor yet.
+    if cursor:
+        cursor_created_at, cursor_id = decode_page_cursor(cursor)
+        query = query.where(
+            tuple_(SlangTerm.created_at, SlangTerm.id) < (cursor_created_at, cursor_id)
+        )
+    elif skip:
+        query = query.offset(skip)
+
+    # Fetch one extra row to learn whether another page exists
+    terms = (
+        await db.execute(
+            query.order_by(desc(SlangTerm.created_at), desc(SlangTerm.id)).limit(limit + 1)
+        )
+    ).scalars().all()
+
+    if len(terms) > limit:
+        terms = terms[:limit]
+        response.headers["X-Next-Cursor"] = encode_page_cursor(terms[-1])
+
+    # vote_count is denormalized on the row, so one query covers everything
+    results = [SlangTermResponse.from_orm(term) for term in terms]
+
+    if cacheable:
+        try:
+            await redis_client.setex(feed_key, 30, orjson.dumps({
+                "items": [result.dict() for result in results],
+                "next_cursor": response.headers.get("X-Next-Cursor")
+            }))
+        except Exception:
+            pass
+
+    return results
 
 @router.get("/{slang_id}", response_model=SlangTermDetail)
 async def get_slang_term_by_id(
     slang_term: SlangTerm = Depends(get_slang_term),
-    db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_current_user)
 ):
     """Get a specific slang term by ID"""
@@ -132,25 +208,17 @@ async def get_slang_term_by_id(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Not authorized to view this unverified slang term"
             )
-    
-    # Get vote count
-    vote_count = db.query(func.sum(SlangVote.vote)).filter(SlangVote.slang_id == slang_term.id).scalar() or 0
-    
-    # Get translations
-    translations = db.query(SlangTranslation).filter(SlangTranslation.slang_id == slang_term.id).all()
-    
-    # Build response
-    response = SlangTermDetail.from_orm(slang_term)
-    response.vote_count = vote_count
-    response.translations = [TranslationResponse.from_orm(t) for t in translations]
-    
-    return response
+
+    # Translations and submitter were eager-loaded by the dependency,
+    # and vote_count is already on the term row, so no further queries
+    return SlangTermDetail.from_orm(slang_term)
 
 @router.put("/{slang_id}", response_model=SlangTermResponse)
 async def update_slang_term(
     slang_update: SlangTermCreate,
     slang_term: SlangTerm = Depends(check_slang_owner),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
 ):
     """Update a slang term (only by owner or moderator)"""
     # Update the term fields
@@ -162,51 +230,46 @@ async def update_slang_term(
     slang_term.pronunciation = slang_update.pronunciation
     slang_term.alternative_spellings = slang_update.alternative_spellings or []
     slang_term.examples = slang_update.examples or []
-    
+
     # If user is not a moderator/admin, mark as unverified after update
-    current_user = slang_term.submitter
     if current_user.role not in ["admin", "moderator"]:
         slang_term.is_verified = False
-    
-    # Update embedding
-    text_to_embed = f"{slang_term.term} {slang_term.meaning}"
-    if slang_term.examples:
-        text_to_embed += " " + " ".join(slang_term.examples[:2])
-    slang_term.embedding = embedding_service.get_embedding(text_to_embed)
-    
-    db.commit()
-    db.refresh(slang_term)
-    
-    # Rebuild index if term is verified
+
+    # Update the embedding text and vector, off the event loop since
+    # it runs the transformer; a no-op edit keeps the stored vector
+    embedding_changed = await asyncio.to_thread(
+        embedding_service.refresh_embed_fields, slang_term
+    )
+
+    await db.commit()
+
+    # Refresh the term in the index, or hide it if it dropped back
+    # to unverified pending re-moderation
     if slang_term.is_verified:
-        embedding_service.build_index(db)
-    
-    # Get vote count
-    vote_count = db.query(func.sum(SlangVote.vote)).filter(SlangVote.slang_id == slang_term.id).scalar() or 0
-    
-    # Build response
-    response = SlangTermResponse.from_orm(slang_term)
-    response.vote_count = vote_count
-    
-    return response
+        if embedding_changed:
+            embedding_service.add_or_update(slang_term)
+    else:
+        embedding_service.remove(slang_term.id)
+
+    # Build response; vote_count is already on the term row
+    return SlangTermResponse.from_orm(slang_term)
 
 @router.delete("/{slang_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_slang_term(
     slang_term: SlangTerm = Depends(check_slang_owner),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete a slang term (only by owner or moderator)"""
-    # Delete associated votes and translations first
-    db.query(SlangVote).filter(SlangVote.slang_id == slang_term.id).delete()
-    db.query(SlangTranslation).filter(SlangTranslation.slang_id == slang_term.id).delete()
-    
-    # Then delete the term
-    db.delete(slang_term)
-    db.commit()
-    
-    # Rebuild index
-    embedding_service.build_index(db)
-    
+    term_id = slang_term.id
+
+    # One DELETE; votes, translations and favorite rows go with it via
+    # the ON DELETE CASCADE foreign keys
+    await db.execute(delete(SlangTerm).where(SlangTerm.id == term_id))
+    await db.commit()
+
+    # Hide the term in the index without a rebuild
+    embedding_service.remove(term_id)
+
     return None
 
 @router.post("/generate-explanation", response_model=SlangTermCreate)
@@ -216,14 +279,8 @@ async def generate_slang_explanation(
     current_user: User = Depends(get_current_user)
 ):
     """Use AI to generate an explanation for a slang term"""
-    explanation_json = await ai_service.generate_explanation(term, context)
-    
-    # Parse the JSON response if it's a string
-    if isinstance(explanation_json, str):
-        explanation = json.loads(explanation_json)
-    else:
-        explanation = explanation_json
-    
+    explanation = await ai_service.generate_explanation(term, context)
+
     # Convert to SlangTermCreate schema
     result = SlangTermCreate(
         term=term,
@@ -235,42 +292,81 @@ async def generate_slang_explanation(
         examples=explanation.get("examples", []),
         context=context
     )
-    
+
     return result
 
+@router.post("/generate-explanation/batch", response_model=List[SlangTermCreate])
+async def generate_slang_explanations_batch(
+    terms: List[str],
+    context: Optional[str] = Query(None, description="Optional context shared by the terms"),
+    current_user: User = Depends(get_current_user)
+):
+    """Use AI to generate explanations for several slang terms at once"""
+    terms = [term.strip() for term in terms if term.strip()]
+    if not terms:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one non-empty term is required"
+        )
+    if len(terms) > 50:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At most 50 terms per batch"
+        )
+
+    # The calls run concurrently, bounded by the shared OpenAI semaphore
+    explanations = await ai_service.generate_explanations_batch(terms, context)
+
+    return [
+        SlangTermCreate(
+            term=term,
+            meaning=explanation.get("meaning", ""),
+            origin=explanation.get("origin"),
+            part_of_speech=explanation.get("part_of_speech"),
+            pronunciation=explanation.get("pronunciation"),
+            alternative_spellings=explanation.get("alternative_spellings", []),
+            examples=explanation.get("examples", []),
+            context=context
+        )
+        for term, explanation in zip(terms, explanations)
+    ]
+
 @router.post("/translations", response_model=TranslationResponse)
 async def create_translation(
     translation: TranslationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Add a translation for a slang term"""
     # Check if slang term exists
-    slang_term = db.query(SlangTerm).filter(SlangTerm.id == translation.slang_id).first()
+    slang_term = (
+        await db.execute(
+            select(SlangTerm.id).where(SlangTerm.id == translation.slang_id)
+        )
+    ).first()
     if not slang_term:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Slang term with ID {translation.slang_id} not found"
         )
-    
+
     # Check if translation already exists for this language
     existing = (
-        db.query(SlangTranslation)
-        .filter(
-            SlangTranslation.slang_id == translation.slang_id,
-            SlangTranslation.language == translation.language
+        await db.execute(
+            select(SlangTranslation).where(
+                SlangTranslation.slang_id == translation.slang_id,
+                SlangTranslation.language == translation.language
+            )
         )
-        .first()
-    )
-    
+    ).scalar_one_or_none()
+
     if existing:
         # Update existing translation
         existing.translation = translation.translation
         existing.examples = translation.examples or []
-        db.commit()
-        db.refresh(existing)
+        await db.commit()
         return TranslationResponse.from_orm(existing)
-    
+
     # Create new translation
     new_translation = SlangTranslation(
         slang_id=translation.slang_id,
@@ -278,11 +374,10 @@ async def create_translation(
         translation=translation.translation,
         examples=translation.examples or []
     )
-    
+
     db.add(new_translation)
-    db.commit()
-    db.refresh(new_translation)
-    
+    await db.commit()
+
     return TranslationResponse.from_orm(new_translation)
 
 @router.post("/generate-translation", response_model=Dict)
@@ -295,13 +390,7 @@ async def generate_translation(
 ):
     """Use AI to generate a translation for a slang term"""
     examples_list = examples.split("|") if examples else None
-    
-    translation_json = await ai_service.translate_slang(term, target_language, meaning, examples_list)
-    
-    # Parse the JSON response if it's a string
-    if isinstance(translation_json, str):
-        translation = json.loads(translation_json)
-    else:
-        translation = translation_json
-    
-    return translation
\ No newline at end of file
+
+    translation = await ai_service.translate_slang(term, target_language, meaning, examples_list)
+
+    return translation
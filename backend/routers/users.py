@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
 from database import get_db
 from models import User, SlangTerm, user_favorites, SearchHistory
 from schemas import UserResponse, UserCreate, SlangTermResponse, FavoriteToggle
-from auth import get_current_user, get_admin_user
+from auth import get_current_user, get_admin_user, invalidate_user_cache
+from dependencies import encode_page_cursor, decode_page_cursor
 
 router = APIRouter(
     prefix="/users",
@@ -23,159 +27,174 @@ async def get_current_user_info(
 async def update_user_profile(
     user_update: UserCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Update current user profile"""
     # Validate username uniqueness if changed
     if user_update.username and user_update.username != current_user.username:
-        existing_user = db.query(User).filter(User.username == user_update.username).first()
+        existing_user = (
+            await db.execute(
+                select(User.id).where(User.username == user_update.username)
+            )
+        ).first()
         if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail="Username already taken"
             )
-    
-    # Update user fields
+
+    # Update user fields; the cached row may be detached, so write
+    # through a merged copy on this session
     current_user.username = user_update.username
     current_user.native_language = user_update.native_language
     current_user.learning_languages = user_update.learning_languages or []
-    
-    db.commit()
-    db.refresh(current_user)
-    
+    current_user = await db.merge(current_user)
+
+    await db.commit()
+    invalidate_user_cache(current_user.id)
+
     return current_user
 
 @router.get("/favorites", response_model=List[SlangTermResponse])
 async def get_favorites(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get user's favorite slang terms"""
-    # Query favorites with pagination
-    favorites = (
-        db.query(SlangTerm)
+    # Keyset pagination on the term id (the association rows carry no
+    # timestamp); skip remains as a fallback for older clients
+    query = (
+        select(SlangTerm)
         .join(user_favorites)
-        .filter(user_favorites.c.user_id == current_user.id)
-        .offset(skip)
-        .limit(limit)
-        .all()
+        .where(user_favorites.c.user_id == current_user.id)
     )
-    
-    # Add vote counts to each term
-    results = []
-    for term in favorites:
-        vote_count = (
-            db.query(SlangTerm.votes)
-            .filter(SlangTerm.votes.slang_id == term.id)
-            .with_entities(SlangTerm.votes.vote)
-            .scalar() or 0
+    if cursor:
+        try:
+            cursor_id = int(cursor)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid pagination cursor"
+            )
+        query = query.where(SlangTerm.id < cursor_id)
+    elif skip:
+        query = query.offset(skip)
+
+    favorites = (
+        await db.execute(
+            query.order_by(SlangTerm.id.desc()).limit(limit + 1)
         )
-        term_response = SlangTermResponse.from_orm(term)
-        term_response.vote_count = vote_count
-        results.append(term_response)
-    
-    return results
+    ).scalars().all()
+
+    if len(favorites) > limit:
+        favorites = favorites[:limit]
+        response.headers["X-Next-Cursor"] = str(favorites[-1].id)
+
+    # vote_count is denormalized on the row, so one query covers everything
+    return [SlangTermResponse.from_orm(term) for term in favorites]
 
 @router.post("/favorites", status_code=status.HTTP_200_OK)
 async def toggle_favorite(
     favorite: FavoriteToggle,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Add or remove a slang term from favorites"""
-    # Check if term exists
-    term = db.query(SlangTerm).filter(SlangTerm.id == favorite.slang_id).first()
-    if not term:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Slang term with ID {favorite.slang_id} not found"
-        )
-    
-    # Check if already in favorites
-    is_favorite = (
-        db.query(user_favorites)
-        .filter(
-            user_favorites.c.user_id == current_user.id,
-            user_favorites.c.slang_id == favorite.slang_id
-        )
-        .first() is not None
-    )
-    
-    # Toggle favorite status
-    if is_favorite:
-        # Remove from favorites
-        db.execute(
-            user_favorites.delete().where(
+    # Try the remove first: DELETE ... RETURNING both removes the row
+    # and reports whether it existed, replacing the membership probe
+    removed = (
+        await db.execute(
+            delete(user_favorites)
+            .where(
                 user_favorites.c.user_id == current_user.id,
                 user_favorites.c.slang_id == favorite.slang_id
             )
+            .returning(user_favorites.c.slang_id)
         )
-        action = "removed"
-    else:
-        # Add to favorites
-        db.execute(
-            user_favorites.insert().values(
-                user_id=current_user.id,
-                slang_id=favorite.slang_id
-            )
+    ).first() is not None
+    if removed:
+        await db.commit()
+        return {"status": "success", "action": "removed", "slang_id": favorite.slang_id}
+
+    # Not a favorite yet: upsert so a concurrent duplicate toggle is a
+    # no-op; the FK violation doubles as the term-existence check
+    try:
+        await db.execute(
+            pg_insert(user_favorites)
+            .values(user_id=current_user.id, slang_id=favorite.slang_id)
+            .on_conflict_do_nothing(index_elements=["user_id", "slang_id"])
+        )
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Slang term with ID {favorite.slang_id} not found"
         )
-        action = "added"
-    
-    db.commit()
-    
-    return {"status": "success", "action": action, "slang_id": favorite.slang_id}
+
+    return {"status": "success", "action": "added", "slang_id": favorite.slang_id}
 
 @router.get("/submissions", response_model=List[SlangTermResponse])
 async def get_user_submissions(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get slang terms submitted by the current user"""
-    # Query submissions with pagination
+    # Keyset pagination on (created_at, id); skip remains as a fallback
+    # for older clients
+    query = select(SlangTerm).where(SlangTerm.submitted_by == current_user.id)
+    if cursor:
+        cursor_created_at, cursor_id = decode_page_cursor(cursor)
+        query = query.where(
+            tuple_(SlangTerm.created_at, SlangTerm.id) < (cursor_created_at, cursor_id)
+        )
+    elif skip:
+        query = query.offset(skip)
+
     submissions = (
-        db.query(SlangTerm)
-        .filter(SlangTerm.submitted_by == current_user.id)
-        .order_by(SlangTerm.created_at.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
-    )
-    
-    # Add vote counts to each term
-    results = []
-    for term in submissions:
-        vote_count = db.query(SlangTerm.votes).filter(SlangTerm.votes.slang_id == term.id).count() or 0
-        term_response = SlangTermResponse.from_orm(term)
-        term_response.vote_count = vote_count
-        results.append(term_response)
-    
-    return results
+        await db.execute(
+            query.order_by(SlangTerm.created_at.desc(), SlangTerm.id.desc()).limit(limit + 1)
+        )
+    ).scalars().all()
+
+    if len(submissions) > limit:
+        submissions = submissions[:limit]
+        response.headers["X-Next-Cursor"] = encode_page_cursor(submissions[-1])
+
+    # vote_count is denormalized on the row, so one query covers everything
+    return [SlangTermResponse.from_orm(term) for term in submissions]
 
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user_by_id(
     user_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_admin_user)  # Only admins can view other user profiles
 ):
     """Get user by ID (admin only)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = (
+        await db.execute(select(User).where(User.id == user_id))
+    ).scalar_one_or_none()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with ID {user_id} not found"
         )
-    
+
     return user
 
 @router.put("/{user_id}/role", response_model=UserResponse)
 async def update_user_role(
     user_id: str,
     role: str = Query(..., description="New role (user, moderator, admin)"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_admin_user)  # Only admins can update roles
 ):
     """Update user role (admin only)"""
@@ -185,18 +204,20 @@ async def update_user_role(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid role. Must be 'user', 'moderator', or 'admin'."
         )
-    
+
     # Get user to update
-    user = db.query(User).filter(User.id == user_id).first()
+    user = (
+        await db.execute(select(User).where(User.id == user_id))
+    ).scalar_one_or_none()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with ID {user_id} not found"
         )
-    
+
     # Update role
     user.role = role
-    db.commit()
-    db.refresh(user)
-    
-    return user
\ No newline at end of file
+    await db.commit()
+    invalidate_user_cache(user.id)
+
+    return user
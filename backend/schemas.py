@@ -100,10 +100,14 @@ class SearchResponse(BaseModel):
     results: List[SlangTermResponse]
     query: str
     count: int
-    
+
     class Config:
         orm_mode = True
 
+class BulkSearchQuery(BaseModel):
+    queries: List[str]
+    limit: int = 10
+
 # AI Generation Schemas
 class ExplanationRequest(BaseModel):
     term: str
@@ -121,6 +125,27 @@ class TranslationRequest(BaseModel):
     meaning: Optional[str] = None
     examples: Optional[List[str]] = None
 
+# AI Response Schemas (shape of the JSON returned by the LLM)
+class AIExplanation(BaseModel):
+    meaning: str
+    origin: str = "unknown"
+    examples: List[str] = []
+    pronunciation: str = "unknown"
+    part_of_speech: str = "unknown"
+    alternative_spellings: List[str] = []
+
+class AITranslation(BaseModel):
+    translation: str
+    literal_translation: str = "unknown"
+    examples: List[str] = []
+
+class AIModeration(BaseModel):
+    is_appropriate: bool
+    is_accurate: bool
+    examples_match: bool
+    suggestions: str = ""
+    confidence: float = 0.0
+
 # Admin Schemas
 class ModerateRequest(BaseModel):
     slang_id: int
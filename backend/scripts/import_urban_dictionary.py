@@ -6,23 +6,35 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import SessionLocal
 from models import SlangTerm
-from ai_service import fetch_from_urban_dictionary
+from ai_service import ai_service
+from embeddings import embedding_service
 
 async def import_terms(terms):
     """Import terms from Urban Dictionary"""
     db = SessionLocal()
-    
-    for term in terms:
-        # Check if term already exists
-        existing = db.query(SlangTerm).filter(SlangTerm.term == term).first()
-        if existing:
-            print(f"Term '{term}' already exists, skipping...")
-            continue
-            
-        print(f"Importing '{term}'...")
-        definition = await fetch_from_urban_dictionary(term)
-        
-        new_term = SlangTerm(
+
+    # One query finds every term that already exists instead of one
+    # round-trip per candidate
+    existing = {
+        row[0]
+        for row in db.query(SlangTerm.term).filter(SlangTerm.term.in_(terms)).all()
+    }
+    for term in existing:
+        print(f"Term '{term}' already exists, skipping...")
+
+    new_terms = [term for term in terms if term not in existing]
+    if not new_terms:
+        print("Nothing to import.")
+        return
+
+    # Fan the UD fetches out concurrently; they are independent HTTP calls
+    print(f"Importing {len(new_terms)} terms...")
+    definitions = await asyncio.gather(
+        *[ai_service.fetch_from_urban_dictionary(term) for term in new_terms]
+    )
+
+    new_objects = [
+        SlangTerm(
             term=term,
             meaning=definition.get("meaning", ""),
             origin=definition.get("origin"),
@@ -30,9 +42,19 @@ async def import_terms(terms):
             context="Imported from Urban Dictionary",
             is_verified=True
         )
-        
-        db.add(new_term)
-    
+        for term, definition in zip(new_terms, definitions)
+    ]
+
+    # Embed the whole batch in one model call; per-item encodes pay the
+    # transformer overhead N times over
+    texts = [embedding_service.get_text_to_embed(obj) for obj in new_objects]
+    embeddings = embedding_service.encode_batch(texts)
+    for obj, text, embedding in zip(new_objects, texts, embeddings):
+        obj.embed_text = text
+        obj.embedding = embedding
+
+    # Single bulk INSERT and one commit for the whole import
+    db.bulk_save_objects(new_objects)
     db.commit()
     print("Import complete!")
 
@@ -40,6 +62,6 @@ if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python import_urban_dictionary.py term1 term2 term3 ...")
         sys.exit(1)
-        
+
     terms = sys.argv[1:]
-    asyncio.run(import_terms(terms))
\ No newline at end of file
+    asyncio.run(import_terms(terms))